@@ -1,11 +1,13 @@
 import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
-from .db import Base, ENGINE
-from .routers import detect, layout, metrics, ocr, process, results, upload, vlm
-from .services import pdf_service
+from .db import Base, ENGINE, ensure_columns
+from .routers import detect, layout, metrics, ocr, pages, process, results, upload, vlm
+from .services import cache_service, pdf_service, vlm_service
 
 
 def _ensure_data_dir() -> None:
@@ -21,10 +23,18 @@ def _ensure_data_dir() -> None:
             pdf_service.cleanup_results(dirs["results"], max_age_days)
 
 
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    yield
+    vlm_service.close_clients()
+    cache_service.flush_raster_cache()
+
+
 def create_app() -> FastAPI:
     _ensure_data_dir()
     Base.metadata.create_all(bind=ENGINE)
-    app = FastAPI(title="Construction Vision API")
+    ensure_columns()
+    app = FastAPI(title="Construction Vision API", lifespan=_lifespan)
     data_dir = os.path.join(os.path.dirname(__file__), "data")
     app.mount("/files", StaticFiles(directory=os.path.abspath(data_dir)), name="files")
     allow_origins = os.getenv(
@@ -40,6 +50,7 @@ def create_app() -> FastAPI:
     )
     app.include_router(upload.router)
     app.include_router(process.router)
+    app.include_router(pages.router)
     app.include_router(ocr.router)
     app.include_router(vlm.router)
     app.include_router(layout.router)
@@ -13,6 +13,7 @@ class Document(Base):
     uploaded_at = Column(DateTime, default=dt.datetime.utcnow, nullable=False)
     page_count = Column(Integer, default=0, nullable=False)
     metadata_json = Column(Text, nullable=True)
+    content_hash = Column(String, nullable=True, index=True)
 
     runs = relationship("ProcessRun", back_populates="document", cascade="all, delete-orphan")
 
@@ -27,5 +28,6 @@ class ProcessRun(Base):
     started_at = Column(DateTime, default=dt.datetime.utcnow, nullable=False)
     finished_at = Column(DateTime, nullable=True)
     output_json = Column(Text, nullable=True)
+    params_hash = Column(String, nullable=True, index=True)
 
     document = relationship("Document", back_populates="runs")
@@ -1,68 +1,89 @@
-import datetime as dt
-import json
-import os
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 
 from ..db import get_db
-from ..models import Document, ProcessRun
+from ..models import Document
 from ..schemas import DetectionRequest, ProcessRunOut
-from ..services import detection_service, pdf_service
+from ..services import detection_service, pdf_service, preprocess_service, run_service
+from . import streaming
 
 
 router = APIRouter(prefix="/detect", tags=["detect"])
 
 
+def _prepare(document_id: int, payload: DetectionRequest, db: Session):
+    document = db.query(Document).filter(Document.id == document_id).first()
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found.")
+
+    try:
+        pages = pdf_service.parse_page_selection(payload.pages, document.page_count)
+        preprocess_service.parse_steps(payload.preprocess)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    stage = f"detect:{payload.provider}"
+    key = run_service.params_key(
+        run_service.document_hash(db, document),
+        stage,
+        {**payload.model_dump(exclude={"reuse"}), "pages": pages},
+    )
+    return document, pages, stage, key
+
+
+def _run(pdf_path: str, payload: DetectionRequest, pages, on_page=None):
+    return detection_service.run_detection(
+        pdf_path,
+        payload.provider,
+        targets=payload.targets,
+        pages=pages,
+        dpi=payload.dpi,
+        max_edge=payload.max_edge,
+        preprocess=payload.preprocess,
+        on_page=on_page,
+    )
+
+
 @router.post("/{document_id}", response_model=ProcessRunOut)
 def run_detection(
     document_id: int,
     payload: DetectionRequest,
     db: Session = Depends(get_db),
 ):
-    document = db.query(Document).filter(Document.id == document_id).first()
-    if not document:
-        raise HTTPException(status_code=404, detail="Document not found.")
-
-    run = ProcessRun(
-        document_id=document.id,
-        stage=f"detect:{payload.provider}",
-        status="running",
-        started_at=dt.datetime.utcnow(),
-    )
-    db.add(run)
-    db.commit()
-    db.refresh(run)
+    document, pages, stage, key = _prepare(document_id, payload, db)
+    if payload.reuse:
+        reused = run_service.find_reusable_run(db, document, stage, key)
+        if reused:
+            return run_service.run_out(reused)
 
+    run = run_service.start_run(db, document, stage, key)
     output = {}
     try:
-        output = detection_service.run_detection(
-            document.stored_path, payload.provider, targets=payload.targets
-        )
+        output = _run(document.stored_path, payload, pages)
         run.status = "completed"
     except Exception as exc:
         output = {"error": str(exc)}
         run.status = "failed"
     finally:
-        run.finished_at = dt.datetime.utcnow()
-        base_dir = os.path.join(os.path.dirname(__file__), "..", "data")
-        dirs = pdf_service.ensure_dirs(os.path.abspath(base_dir))
-        stem = f"run_{run.id}_{run.stage.replace(':', '_')}"
-        artifact_path = pdf_service.write_json(output, dirs["results"], stem)
-        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
-        relative_path = os.path.relpath(artifact_path, base_dir)
-        output["artifact"] = {
-            "path": artifact_path,
-            "url": f"/files/{relative_path.replace(os.sep, '/')}",
-        }
-        run.output_json = json.dumps(output)
-        db.commit()
-
-    return ProcessRunOut(
-        id=run.id,
-        document_id=run.document_id,
-        stage=run.stage,
-        status=run.status,
-        started_at=run.started_at,
-        finished_at=run.finished_at,
-        output=output,
+        output = run_service.finish_run(db, run, output)
+
+    return run_service.run_out(run, output)
+
+
+@router.post("/{document_id}/stream")
+def stream_detection(
+    document_id: int, payload: DetectionRequest, request: Request, db: Session = Depends(get_db)
+):
+    """Like ``POST /detect/{id}`` but streams each page as soon as it is detected."""
+    document, pages, stage, key = _prepare(document_id, payload, db)
+    accept = request.headers.get("accept")
+    if payload.reuse:
+        reused = run_service.find_reusable_run(db, document, stage, key)
+        if reused:
+            return streaming.replay_run(reused, accept)
+
+    run = run_service.start_run(db, document, stage, key)
+    pdf_path = document.stored_path
+    return streaming.stream_run(
+        run, lambda on_page: _run(pdf_path, payload, pages, on_page), accept
     )
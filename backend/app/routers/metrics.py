@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 
 from ..db import get_db
 from ..models import Document, ProcessRun
+from ..services import model_registry
 
 
 router = APIRouter(prefix="/metrics", tags=["metrics"])
@@ -27,8 +28,18 @@ def _parse_run_metrics(run: ProcessRun) -> Dict[str, Any]:
     total_tokens = 0
     confidences = []
 
+    # Columnar runs keep only per-page counts; their scores are summarized in "columnar"
+    columnar = output.get("columnar") if isinstance(output, dict) else None
+    if not isinstance(columnar, dict):
+        columnar = None
+
     for page in pages:
         if isinstance(page, dict):
+            if columnar:
+                total_words += int(page.get("word_count") or 0)
+                total_detections += int(page.get("detection_count") or 0)
+                total_tokens += int(page.get("token_count") or 0)
+
             # OCR words
             words = page.get("words", [])
             if isinstance(words, list):
@@ -60,7 +71,14 @@ def _parse_run_metrics(run: ProcessRun) -> Dict[str, Any]:
     if elapsed_ms is None and run.started_at and run.finished_at:
         elapsed_ms = int((run.finished_at - run.started_at).total_seconds() * 1000)
 
-    avg_confidence = sum(confidences) / len(confidences) if confidences else None
+    confidence_sum = sum(confidences)
+    confidence_count = len(confidences)
+    if columnar:
+        for table in (columnar.get("tables") or {}).values():
+            if table.get("avg_confidence") is not None and table.get("scored"):
+                confidence_sum += table["avg_confidence"] * table["scored"]
+                confidence_count += table["scored"]
+    avg_confidence = confidence_sum / confidence_count if confidence_count else None
 
     # Parse stage to get provider info
     stage_parts = run.stage.split(":")
@@ -83,9 +101,25 @@ def _parse_run_metrics(run: ProcessRun) -> Dict[str, Any]:
         "avg_confidence": avg_confidence,
         "model": output.get("model"),
         "prompt_key": output.get("prompt_key"),
+        # VLM telemetry (None for other stages)
+        "prompt_tokens": metrics.get("prompt_tokens"),
+        "completion_tokens": metrics.get("completion_tokens"),
+        "load_ms": metrics.get("load_ms"),
+        "avg_queue_ms": metrics.get("avg_queue_ms"),
+        "avg_ttft_ms": metrics.get("avg_ttft_ms"),
+        "p95_ttft_ms": metrics.get("p95_ttft_ms"),
+        "avg_latency_ms": metrics.get("avg_latency_ms"),
+        "p50_latency_ms": metrics.get("p50_latency_ms"),
+        "p95_latency_ms": metrics.get("p95_latency_ms"),
     }
 
 
+@router.get("/models")
+def get_model_registry():
+    """Warm models held by the process, with load time and resident size."""
+    return model_registry.REGISTRY.stats()
+
+
 @router.get("/{document_id}")
 def get_document_metrics(document_id: int, db: Session = Depends(get_db)):
     """Get unified metrics for all runs of a document."""
@@ -1,62 +1,179 @@
 import datetime as dt
-import json
-import os
-from fastapi import APIRouter, Depends, HTTPException
+
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 
 from ..db import get_db
-from ..models import Document, ProcessRun
-from ..schemas import OcrRequest, ProcessRunOut
-from ..services import ocr_service, pdf_service
+from ..models import Document
+from ..schemas import OcrCompareOut, OcrCompareRequest, OcrRequest, ProcessRunOut
+from ..services import ocr_service, pdf_service, preprocess_service, run_service
+from . import streaming
 
 
 router = APIRouter(prefix="/ocr", tags=["ocr"])
 
 
-@router.post("/{document_id}", response_model=ProcessRunOut)
-def run_ocr(document_id: int, payload: OcrRequest, db: Session = Depends(get_db)):
+def _prepare(document_id: int, payload: OcrRequest, db: Session):
     document = db.query(Document).filter(Document.id == document_id).first()
     if not document:
         raise HTTPException(status_code=404, detail="Document not found.")
 
-    run = ProcessRun(
-        document_id=document.id,
-        stage=f"ocr:{payload.provider}",
-        status="running",
-        started_at=dt.datetime.utcnow(),
+    try:
+        pages = pdf_service.parse_page_selection(payload.pages, document.page_count)
+        preprocess_service.parse_steps(payload.preprocess)
+        ocr_service.parse_regions(payload.regions)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    stage = f"ocr:{payload.provider}"
+    key = run_service.params_key(
+        run_service.document_hash(db, document),
+        stage,
+        {
+            **payload.model_dump(exclude={"reuse", "workers", "batch_size", "cache"}),
+            "pages": pages,
+        },
+    )
+    return document, pages, stage, key
+
+
+def _run(pdf_path: str, payload: OcrRequest, pages, on_page=None):
+    return ocr_service.run_ocr(
+        pdf_path,
+        payload.provider,
+        fallback_provider=payload.fallback_provider,
+        pages=pages,
+        dpi=payload.dpi,
+        max_edge=payload.max_edge,
+        workers=payload.workers,
+        batch_size=payload.batch_size,
+        cache=payload.cache,
+        regions=payload.regions,
+        preprocess=payload.preprocess,
+        on_page=on_page,
     )
-    db.add(run)
-    db.commit()
-    db.refresh(run)
 
+
+@router.post("/{document_id}", response_model=ProcessRunOut)
+def run_ocr(document_id: int, payload: OcrRequest, db: Session = Depends(get_db)):
+    document, pages, stage, key = _prepare(document_id, payload, db)
+    if payload.reuse:
+        reused = run_service.find_reusable_run(db, document, stage, key)
+        if reused:
+            return run_service.run_out(reused)
+
+    run = run_service.start_run(db, document, stage, key)
     output = {}
     try:
-        output = ocr_service.run_ocr(document.stored_path, payload.provider)
+        output = _run(document.stored_path, payload, pages)
         run.status = "completed"
     except Exception as exc:
         output = {"error": str(exc)}
         run.status = "failed"
     finally:
-        run.finished_at = dt.datetime.utcnow()
-        base_dir = os.path.join(os.path.dirname(__file__), "..", "data")
-        dirs = pdf_service.ensure_dirs(os.path.abspath(base_dir))
-        stem = f"run_{run.id}_{run.stage.replace(':', '_')}"
-        artifact_path = pdf_service.write_json(output, dirs["results"], stem)
-        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
-        relative_path = os.path.relpath(artifact_path, base_dir)
-        output["artifact"] = {
-            "path": artifact_path,
-            "url": f"/files/{relative_path.replace(os.sep, '/')}",
-        }
-        run.output_json = json.dumps(output)
-        db.commit()
-
-    return ProcessRunOut(
-        id=run.id,
-        document_id=run.document_id,
-        stage=run.stage,
-        status=run.status,
-        started_at=run.started_at,
-        finished_at=run.finished_at,
-        output=output,
+        output = run_service.finish_run(db, run, output)
+
+    return run_service.run_out(run, output)
+
+
+@router.post("/{document_id}/stream")
+def stream_ocr(
+    document_id: int, payload: OcrRequest, request: Request, db: Session = Depends(get_db)
+):
+    """Like ``POST /ocr/{id}`` but streams each page as soon as it is OCRed."""
+    document, pages, stage, key = _prepare(document_id, payload, db)
+    accept = request.headers.get("accept")
+    if payload.reuse:
+        reused = run_service.find_reusable_run(db, document, stage, key)
+        if reused:
+            return streaming.replay_run(reused, accept)
+
+    run = run_service.start_run(db, document, stage, key)
+    pdf_path = document.stored_path
+    return streaming.stream_run(
+        run, lambda on_page: _run(pdf_path, payload, pages, on_page), accept
+    )
+
+
+@router.post("/{document_id}/compare", response_model=OcrCompareOut)
+def compare_ocr(document_id: int, payload: OcrCompareRequest, db: Session = Depends(get_db)):
+    """Run several OCR providers concurrently over one render; one run per provider."""
+    document = db.query(Document).filter(Document.id == document_id).first()
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    providers = list(dict.fromkeys(provider.lower().strip() for provider in payload.providers))
+    if not providers:
+        raise HTTPException(status_code=400, detail="At least one provider is required.")
+
+    try:
+        pages = pdf_service.parse_page_selection(payload.pages, document.page_count)
+        preprocess_service.parse_steps(payload.preprocess)
+        ocr_service.parse_regions(payload.regions)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    content_hash = run_service.document_hash(db, document)
+    params = {**payload.model_dump(exclude={"reuse", "providers"}), "pages": pages}
+    runs = {}
+    for provider in providers:
+        stage = f"ocr:{provider}"
+        key = run_service.params_key(content_hash, stage, {**params, "compare": providers})
+        reused = run_service.find_reusable_run(db, document, stage, key) if payload.reuse else None
+        runs[provider] = reused or run_service.start_run(db, document, stage, key)
+
+    pending = [provider for provider in providers if runs[provider].status == "running"]
+    results = {}
+    if pending:
+        try:
+            results = ocr_service.compare_ocr(
+                document.stored_path,
+                pending,
+                dpi=payload.dpi,
+                max_edge=payload.max_edge,
+                pages=pages,
+                fallback_provider=payload.fallback_provider,
+                workers=payload.workers,
+                batch_size=payload.batch_size,
+                cache=payload.cache,
+                regions=payload.regions,
+                preprocess=payload.preprocess,
+            )
+        except Exception as exc:
+            results = {provider: exc for provider in pending}
+
+    outputs = {}
+    completed = {}
+    for provider in providers:
+        run = runs[provider]
+        if provider not in pending:
+            outputs[provider] = run_service.run_out(run).output or {}
+            completed[provider] = outputs[provider]
+            continue
+        result = results.get(provider)
+        if isinstance(result, dict):
+            run.status = "completed"
+            outputs[provider] = completed[provider] = result
+        else:
+            run.status = "failed"
+            outputs[provider] = {"error": str(result or "Provider did not run.")}
+
+    # Summarize before finish_run moves the words into columnar artifacts.
+    comparison = ocr_service.comparison_summary(completed)
+    for provider in pending:
+        outputs[provider] = run_service.finish_run(db, runs[provider], outputs[provider])
+    comparison["runs"] = {
+        provider: {"run_id": runs[provider].id, "status": runs[provider].status}
+        for provider in providers
+    }
+    stamp = dt.datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    comparison["artifact"] = run_service.write_artifact(
+        comparison, f"compare_{document.id}_ocr_{stamp}"
+    )
+
+    return OcrCompareOut(
+        runs=[
+            run_service.run_out(runs[provider], outputs[provider] if provider in pending else None)
+            for provider in providers
+        ],
+        comparison=comparison,
     )
@@ -0,0 +1,64 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+
+from ..db import get_db
+from ..models import Document
+from ..services import pdf_service
+
+router = APIRouter(prefix="/pages", tags=["pages"])
+
+PAGE_CACHE_HEADERS = {"Cache-Control": "public, max-age=86400"}
+
+
+def _get_document(db: Session, document_id: int) -> Document:
+    document = db.query(Document).filter(Document.id == document_id).first()
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    return document
+
+
+@router.get("/{document_id}/thumbnails")
+def get_thumbnails(
+    document_id: int,
+    dpi: int = Query(24, ge=6, le=96),
+    format: str = "webp",
+    db: Session = Depends(get_db),
+):
+    """Render every page at low DPI and return lazily-served thumbnail URLs."""
+    document = _get_document(db, document_id)
+    pages = range(1, document.page_count + 1)
+    try:
+        pdf_service.render_page_files(document.stored_path, pages, dpi=dpi, fmt=format)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Failed to render thumbnails: {exc}") from exc
+    thumbnails = [
+        {"page": page, "url": f"/pages/{document.id}/{page}?dpi={dpi}&format={format}"}
+        for page in pages
+    ]
+    return {"document_id": document.id, "dpi": dpi, "format": format, "pages": thumbnails}
+
+
+@router.get("/{document_id}/{page}")
+def get_page(
+    document_id: int,
+    page: int,
+    dpi: int = Query(200, ge=6, le=600),
+    format: str = "png",
+    db: Session = Depends(get_db),
+):
+    """Render a single page on first request and serve it from cache afterwards."""
+    document = _get_document(db, document_id)
+    if page < 1 or page > document.page_count:
+        raise HTTPException(status_code=404, detail="Page not found.")
+    try:
+        path, media_type = pdf_service.render_page_file(
+            document.stored_path, page, dpi=dpi, fmt=format
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Failed to render page {page}: {exc}") from exc
+    return FileResponse(path, media_type=media_type, headers=PAGE_CACHE_HEADERS)
@@ -6,7 +6,8 @@ from sqlalchemy.orm import Session
 
 from ..db import get_db
 from ..models import Document, ProcessRun
-from ..schemas import DocumentOut, DocumentResultsOut, ProcessRunOut
+from ..schemas import DocumentOut, DocumentResultsOut
+from ..services import run_service
 
 
 router = APIRouter(prefix="/results", tags=["results"])
@@ -34,20 +35,7 @@ def get_results(document_id: int, db: Session = Depends(get_db)):
         page_count=document.page_count,
         metadata=metadata,
     )
-    runs_out = []
-    for run in runs:
-        output = json.loads(run.output_json) if run.output_json else None
-        runs_out.append(
-            ProcessRunOut(
-                id=run.id,
-                document_id=run.document_id,
-                stage=run.stage,
-                status=run.status,
-                started_at=run.started_at,
-                finished_at=run.finished_at,
-                output=output,
-            )
-        )
+    runs_out = [run_service.run_out(run) for run in runs]
 
     return DocumentResultsOut(document=document_out, runs=runs_out)
 
@@ -67,9 +55,12 @@ def _extract_metrics(run: ProcessRun) -> dict:
         page_count = len(pages)
         for page in pages:
             if isinstance(page, dict):
-                detections += len(page.get("detections") or [])
+                # Columnar runs keep only per-page counts in output_json.
+                detections += int(
+                    page.get("detection_count") or len(page.get("detections") or [])
+                )
                 tokens += int(page.get("token_count") or 0)
-                words += len(page.get("words") or [])
+                words += int(page.get("word_count") or len(page.get("words") or []))
 
     prompt_key = output.get("prompt_key") if isinstance(output, dict) else None
     model = output.get("model") if isinstance(output, dict) else None
@@ -0,0 +1,114 @@
+import json
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from fastapi.responses import StreamingResponse
+
+from ..db import SessionLocal
+from ..models import ProcessRun
+from ..schemas import ProcessRunOut
+from ..services import columnar_service, run_service
+
+Event = Tuple[str, Dict[str, Any]]
+PageCallback = Callable[[Dict[str, Any]], None]
+
+
+def _format(event: str, data: Dict[str, Any], sse: bool) -> str:
+    if sse:
+        return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+    return json.dumps({"event": event, "data": data}, default=str) + "\n"
+
+
+def _response(events: Iterator[Event], accept: Optional[str]) -> StreamingResponse:
+    """NDJSON by default; server-sent events when the client accepts ``text/event-stream``."""
+    sse = "text/event-stream" in (accept or "")
+
+    def body():
+        for event, data in events:
+            yield _format(event, data, sse)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _run_event(run: ProcessRun) -> Dict[str, Any]:
+    return {"id": run.id, "document_id": run.document_id, "stage": run.stage, "status": run.status}
+
+
+def _summary(run: ProcessRun, output: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """The finished run without its pages, which were already sent as ``page`` events."""
+    output = {name: value for name, value in (output or {}).items() if name != "pages"}
+    return ProcessRunOut(
+        id=run.id,
+        document_id=run.document_id,
+        stage=run.stage,
+        status=run.status,
+        started_at=run.started_at,
+        finished_at=run.finished_at,
+        output=output,
+    ).model_dump(mode="json")
+
+
+def stream_run(
+    run: ProcessRun, work: Callable[[PageCallback], Dict[str, Any]], accept: Optional[str]
+) -> StreamingResponse:
+    """Run ``work(on_page)`` on a worker thread and stream its pages as they finish.
+
+    Emits a ``run`` event, one ``page`` event per finished page and a final
+    ``summary`` event. The run is persisted by the worker with its own session, so
+    it completes even if the client disconnects.
+    """
+    run_id = run.id
+    events: "queue.Queue[Optional[Event]]" = queue.Queue()
+    events.put(("run", _run_event(run)))
+
+    def on_page(page: Dict[str, Any]) -> None:
+        events.put(("page", columnar_service.page_records(page)))
+
+    def target() -> None:
+        db = SessionLocal()
+        try:
+            run = db.query(ProcessRun).filter(ProcessRun.id == run_id).first()
+            output = {}
+            try:
+                output = work(on_page)
+                run.status = "completed"
+            except Exception as exc:
+                output = {"error": str(exc)}
+                run.status = "failed"
+            finally:
+                output = run_service.finish_run(db, run, output)
+            events.put(("summary", _summary(run, output)))
+        except Exception as exc:
+            events.put(("error", {"error": str(exc)}))
+        finally:
+            db.close()
+            events.put(None)
+
+    threading.Thread(target=target, name=f"stream-run-{run_id}", daemon=True).start()
+
+    def drain() -> Iterator[Event]:
+        while True:
+            event = events.get()
+            if event is None:
+                return
+            yield event
+
+    return _response(drain(), accept)
+
+
+def replay_run(run: ProcessRun, accept: Optional[str]) -> StreamingResponse:
+    """Stream a stored run (e.g. a reused one) with the same events as :func:`stream_run`."""
+    output = run_service.run_out(run).output or {}
+
+    def events() -> Iterator[Event]:
+        yield "run", _run_event(run)
+        for page in output.get("pages") or []:
+            yield "page", page
+        yield "summary", _summary(run, output)
+
+    return _response(events(), accept)
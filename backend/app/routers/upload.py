@@ -13,14 +13,28 @@ router = APIRouter(prefix="/upload", tags=["upload"])
 
 
 @router.post("/", response_model=DocumentOut)
-async def upload_pdf(file: UploadFile = File(...), db: Session = Depends(get_db)):
+def upload_pdf(file: UploadFile = File(...), db: Session = Depends(get_db)):
     if not file.filename or not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF uploads are supported.")
 
     base_dir = os.path.join(os.path.dirname(__file__), "..", "data")
     dirs = pdf_service.ensure_dirs(os.path.abspath(base_dir))
-    content = await file.read()
-    stored_path = pdf_service.save_upload(file.filename, content, dirs["uploads"])
+    stored_path, content_hash = pdf_service.save_upload(
+        file.filename, file.file, dirs["uploads"]
+    )
+
+    existing = db.query(Document).filter(Document.content_hash == content_hash).first()
+    if existing and os.path.exists(existing.stored_path):
+        os.remove(stored_path)
+        return DocumentOut(
+            id=existing.id,
+            filename=existing.filename,
+            stored_path=existing.stored_path,
+            uploaded_at=existing.uploaded_at,
+            page_count=existing.page_count,
+            metadata=json.loads(existing.metadata_json) if existing.metadata_json else None,
+            deduplicated=True,
+        )
 
     metadata = pdf_service.extract_metadata(stored_path)
     document = Document(
@@ -28,6 +42,7 @@ async def upload_pdf(file: UploadFile = File(...), db: Session = Depends(get_db)
         stored_path=stored_path,
         page_count=metadata.get("page_count", 0),
         metadata_json=json.dumps(metadata),
+        content_hash=content_hash,
     )
     db.add(document)
     db.commit()
@@ -1,70 +1,176 @@
-import datetime as dt
-import json
-import os
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 
 from ..db import get_db
-from ..models import Document, ProcessRun
-from ..schemas import ProcessRunOut, VlmRequest
-from ..services import pdf_service, vlm_service
+from ..models import Document
+from ..schemas import ProcessRunOut, VlmMultiOut, VlmMultiRequest, VlmRequest
+from ..services import pdf_service, run_service, vlm_service
+from . import streaming
 
 
 router = APIRouter(prefix="/vlm", tags=["vlm"])
 
 
-@router.post("/{document_id}", response_model=ProcessRunOut)
-def run_vlm(document_id: int, payload: VlmRequest, db: Session = Depends(get_db)):
+def _prepare(document_id: int, payload: VlmRequest, db: Session):
     document = db.query(Document).filter(Document.id == document_id).first()
     if not document:
         raise HTTPException(status_code=404, detail="Document not found.")
 
-    run = ProcessRun(
-        document_id=document.id,
-        stage=f"vlm:{payload.model}:{payload.prompt_key}",
-        status="running",
-        started_at=dt.datetime.utcnow(),
+    try:
+        pages = pdf_service.parse_page_selection(payload.pages, document.page_count)
+        vlm_service.parse_cache_mode(payload.cache)
+        vlm_service.encode_profile(
+            payload.provider, payload.model, payload.image_format, payload.quality
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    stage = f"vlm:{payload.model}:{payload.prompt_key}"
+    key = run_service.params_key(
+        run_service.document_hash(db, document),
+        stage,
+        {
+            **payload.model_dump(exclude={"reuse", "api_key", "concurrency", "cache"}),
+            "pages": pages,
+        },
+    )
+    return document, pages, stage, key
+
+
+def _run(pdf_path: str, payload: VlmRequest, pages, on_page=None):
+    return vlm_service.run_vlm(
+        pdf_path,
+        prompt_key=payload.prompt_key,
+        model=payload.model,
+        provider=payload.provider,
+        api_key=payload.api_key,
+        max_pages=payload.max_pages,
+        custom_prompt=payload.custom_prompt,
+        pages=pages,
+        dpi=payload.dpi,
+        max_edge=payload.max_edge,
+        concurrency=payload.concurrency,
+        cache=payload.cache,
+        image_format=payload.image_format,
+        quality=payload.quality,
+        on_page=on_page,
     )
-    db.add(run)
-    db.commit()
-    db.refresh(run)
 
+
+@router.post("/{document_id}", response_model=ProcessRunOut)
+def run_vlm(document_id: int, payload: VlmRequest, db: Session = Depends(get_db)):
+    document, pages, stage, key = _prepare(document_id, payload, db)
+    if payload.reuse:
+        reused = run_service.find_reusable_run(db, document, stage, key)
+        if reused:
+            return run_service.run_out(reused)
+
+    run = run_service.start_run(db, document, stage, key)
     output = {}
     try:
-        output = vlm_service.run_vlm(
-            document.stored_path,
-            prompt_key=payload.prompt_key,
-            model=payload.model,
-            provider=payload.provider,
-            api_key=payload.api_key,
-            max_pages=payload.max_pages,
-            custom_prompt=payload.custom_prompt,
-        )
+        output = _run(document.stored_path, payload, pages)
         run.status = "completed"
     except Exception as exc:
         output = {"error": str(exc)}
         run.status = "failed"
     finally:
-        run.finished_at = dt.datetime.utcnow()
-        base_dir = os.path.join(os.path.dirname(__file__), "..", "data")
-        dirs = pdf_service.ensure_dirs(os.path.abspath(base_dir))
-        stem = f"run_{run.id}_{run.stage.replace(':', '_')}"
-        artifact_path = pdf_service.write_json(output, dirs["results"], stem)
-        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
-        relative_path = os.path.relpath(artifact_path, base_dir)
-        output["artifact"] = {
-            "path": artifact_path,
-            "url": f"/files/{relative_path.replace(os.sep, '/')}",
-        }
-        run.output_json = json.dumps(output)
-        db.commit()
-
-    return ProcessRunOut(
-        id=run.id,
-        document_id=run.document_id,
-        stage=run.stage,
-        status=run.status,
-        started_at=run.started_at,
-        finished_at=run.finished_at,
-        output=output,
+        output = run_service.finish_run(db, run, output)
+
+    return run_service.run_out(run, output)
+
+
+@router.post("/{document_id}/stream")
+def stream_vlm(
+    document_id: int, payload: VlmRequest, request: Request, db: Session = Depends(get_db)
+):
+    """Like ``POST /vlm/{id}`` but streams each page as soon as it is answered."""
+    document, pages, stage, key = _prepare(document_id, payload, db)
+    accept = request.headers.get("accept")
+    if payload.reuse:
+        reused = run_service.find_reusable_run(db, document, stage, key)
+        if reused:
+            return streaming.replay_run(reused, accept)
+
+    run = run_service.start_run(db, document, stage, key)
+    pdf_path = document.stored_path
+    return streaming.stream_run(
+        run, lambda on_page: _run(pdf_path, payload, pages, on_page), accept
     )
+
+
+@router.post("/{document_id}/multi", response_model=VlmMultiOut)
+def run_vlm_multi(document_id: int, payload: VlmMultiRequest, db: Session = Depends(get_db)):
+    """Run several prompts over one render; each prompt gets its own run."""
+    document = db.query(Document).filter(Document.id == document_id).first()
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    prompts = [(key, None) for key in dict.fromkeys(payload.prompt_keys) if key != "custom"]
+    prompts += [("custom", text) for text in dict.fromkeys(payload.custom_prompts)]
+    if not prompts:
+        raise HTTPException(status_code=400, detail="At least one prompt is required.")
+
+    try:
+        pages = pdf_service.parse_page_selection(payload.pages, document.page_count)
+        vlm_service.parse_cache_mode(payload.cache)
+        vlm_service.encode_profile(
+            payload.provider, payload.model, payload.image_format, payload.quality
+        )
+        resolved = [vlm_service.resolve_prompt(key, text) for key, text in prompts]
+    except (ValueError, RuntimeError) as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    # Same keys as single-prompt runs, so either endpoint can reuse the other's runs.
+    content_hash = run_service.document_hash(db, document)
+    params = payload.model_dump(
+        exclude={"reuse", "api_key", "concurrency", "cache", "prompt_keys", "custom_prompts"}
+    )
+    runs = []
+    for key, text in prompts:
+        stage = f"vlm:{payload.model}:{key}"
+        run_key = run_service.params_key(
+            content_hash,
+            stage,
+            {**params, "prompt_key": key, "custom_prompt": text, "pages": pages},
+        )
+        reused = None
+        if payload.reuse:
+            reused = run_service.find_reusable_run(db, document, stage, run_key)
+        runs.append(reused or run_service.start_run(db, document, stage, run_key))
+
+    pending = [index for index, run in enumerate(runs) if run.status == "running"]
+    results = {}
+    if pending:
+        try:
+            outputs = vlm_service.run_vlm_prompts(
+                document.stored_path,
+                [(prompts[index][0], resolved[index]) for index in pending],
+                model=payload.model,
+                provider=payload.provider,
+                api_key=payload.api_key,
+                max_pages=payload.max_pages,
+                pages=pages,
+                dpi=payload.dpi,
+                max_edge=payload.max_edge,
+                concurrency=payload.concurrency,
+                cache=payload.cache,
+                image_format=payload.image_format,
+                quality=payload.quality,
+            )
+            results = dict(zip(pending, outputs))
+        except Exception as exc:
+            results = {index: exc for index in pending}
+
+    out = []
+    for index, run in enumerate(runs):
+        if index not in pending:
+            out.append(run_service.run_out(run))
+            continue
+        result = results.get(index)
+        if isinstance(result, dict):
+            run.status = "completed"
+            output = result
+        else:
+            run.status = "failed"
+            output = {"error": str(result or "Prompt did not run.")}
+        out.append(run_service.run_out(run, run_service.finish_run(db, run, output)))
+    return VlmMultiOut(runs=out)
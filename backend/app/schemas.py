@@ -1,5 +1,5 @@
 import datetime as dt
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Union
 from pydantic import BaseModel
 
 
@@ -17,6 +17,9 @@ class DocumentOut(BaseModel):
     uploaded_at: dt.datetime
     page_count: int
     metadata: Optional[Dict[str, Any]] = None
+    # True when an upload matched an earlier Document's content; the fields, including
+    # filename, are then that Document's rather than the uploaded file's.
+    deduplicated: bool = False
 
     class Config:
         from_attributes = True
@@ -41,7 +44,39 @@ class DocumentResultsOut(BaseModel):
 
 
 class OcrRequest(BaseModel):
-    provider: str = "tesseract"
+    provider: str = "tesseract"  # raster engine, "native" (PDF text layer) or "auto"
+    fallback_provider: str = "tesseract"  # Raster engine for "auto" pages without text
+    reuse: bool = False  # Return a completed run with the same content hash and parameters
+    pages: Optional[Union[str, List[int]]] = None  # e.g. "1-5,12" or [1, 2]; all when omitted
+    dpi: Optional[int] = None  # Overrides the provider's render profile
+    max_edge: Optional[int] = None  # Cap on the rendered long edge in pixels
+    workers: Optional[int] = None  # Parallel tesseract processes
+    batch_size: Optional[int] = None  # Pages per Surya inference batch
+    cache: bool = True  # Read and write the per-page OCR cache
+    # Zone presets ("title_block", "general_notes", "revision_table", "drawing_area")
+    # or [x0, y0, x1, y1] page fractions; only these regions are OCRed
+    regions: Optional[List[Union[str, List[float]]]] = None
+    # Any of "grayscale", "deskew", "binarize", "despeckle", "trim"
+    preprocess: Optional[List[str]] = None
+
+
+class OcrCompareRequest(BaseModel):
+    providers: List[str]  # Run concurrently over one shared render
+    fallback_provider: str = "tesseract"
+    reuse: bool = False
+    pages: Optional[Union[str, List[int]]] = None
+    dpi: Optional[int] = None  # Shared render; defaults to the highest provider profile
+    max_edge: Optional[int] = None
+    workers: Optional[int] = None
+    batch_size: Optional[int] = None
+    cache: bool = True
+    regions: Optional[List[Union[str, List[float]]]] = None
+    preprocess: Optional[List[str]] = None
+
+
+class OcrCompareOut(BaseModel):
+    runs: List[ProcessRunOut]  # One per provider, in request order
+    comparison: Dict[str, Any]
 
 
 class VlmRequest(BaseModel):
@@ -51,12 +86,50 @@ class VlmRequest(BaseModel):
     api_key: Optional[str] = None  # Required for OpenAI
     max_pages: Optional[int] = None
     custom_prompt: Optional[str] = None  # Required when prompt_key is "custom"
+    reuse: bool = False
+    pages: Optional[Union[str, List[int]]] = None
+    dpi: Optional[int] = None
+    max_edge: Optional[int] = None
+    concurrency: Optional[int] = None  # Page requests in flight (default VLM_CONCURRENCY)
+    cache: str = "use"  # Response cache: "use", "bypass" or "refresh"
+    image_format: Optional[str] = None  # "auto", "jpeg", "webp" or "png" (default per model)
+    quality: Optional[int] = None  # JPEG/WebP quality (default per model)
+
+
+class VlmMultiRequest(BaseModel):
+    prompt_keys: List[str] = []  # One run per prompt, over one shared render
+    custom_prompts: List[str] = []  # Each runs as its own "custom" prompt
+    model: str = "gpt-4o"
+    provider: str = "openai"
+    api_key: Optional[str] = None
+    max_pages: Optional[int] = None
+    reuse: bool = False
+    pages: Optional[Union[str, List[int]]] = None
+    dpi: Optional[int] = None
+    max_edge: Optional[int] = None
+    concurrency: Optional[int] = None  # Requests in flight across all prompts
+    cache: str = "use"
+    image_format: Optional[str] = None
+    quality: Optional[int] = None
+
+
+class VlmMultiOut(BaseModel):
+    runs: List[ProcessRunOut]  # One per prompt, in request order
 
 
 class LayoutRequest(BaseModel):
     provider: str = "layoutlmv3"
+    reuse: bool = False
+    pages: Optional[Union[str, List[int]]] = None
+    dpi: Optional[int] = None
+    max_edge: Optional[int] = None
 
 
 class DetectionRequest(BaseModel):
     provider: str = "yolov8"
     targets: Optional[List[str]] = None
+    reuse: bool = False
+    pages: Optional[Union[str, List[int]]] = None
+    dpi: Optional[int] = None
+    max_edge: Optional[int] = None
+    preprocess: Optional[List[str]] = None
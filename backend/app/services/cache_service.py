@@ -0,0 +1,354 @@
+import hashlib
+import io
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image
+
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(DATA_DIR, "cache"))
+
+_HASH_CHUNK = 1024 * 1024
+_file_hashes: Dict[Tuple[str, int, int], str] = {}
+_file_hashes_lock = threading.Lock()
+
+
+def _env_mb(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default)) * 1024 * 1024
+    except ValueError:
+        return default * 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    """Return the SHA-256 of a file, memoized on (path, size, mtime)."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _file_hashes_lock:
+        cached = _file_hashes.get(memo_key)
+    if cached:
+        return cached
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    value = digest.hexdigest()
+    with _file_hashes_lock:
+        _file_hashes[memo_key] = value
+    return value
+
+
+def image_digest(image) -> str:
+    """BLAKE2b of a raster's mode, size and pixels."""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{image.mode}:{image.width}x{image.height}:".encode("ascii"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class MemoryLRU:
+    """Thread-safe in-memory LRU bounded by the total size of its entries."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, value: Any, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes and self._entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes}
+
+
+class DiskCache:
+    """Directory of files keyed by content hash, evicted least-recently-used first.
+
+    Access refreshes a file's mtime, so mtime order is LRU order. The total size
+    is scanned once and then tracked incrementally.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, suffix: str = ""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}{self.suffix}")
+
+    def get_path(self, key: str) -> Optional[str]:
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as handle:
+                return handle.read()
+        except OSError:
+            return None
+
+    def put_bytes(self, key: str, data: bytes) -> str:
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as handle:
+            handle.write(data)
+        previous = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size is not None:
+                self._size += len(data) - previous
+        self._evict()
+        return path
+
+    def delete(self, key: str) -> None:
+        path = self.path_for(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size -= size
+
+    def _scan(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self) -> None:
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._scan())
+            if self._size <= self.max_bytes:
+                return
+            entries = sorted(self._scan())
+            self._size = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if self._size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._size -= size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._scan())
+            return {"directory": self.directory, "bytes": self._size, "max_bytes": self.max_bytes}
+
+
+class RasterCache:
+    """Two-tier page raster cache keyed by (PDF hash, page, dpi, colorspace).
+
+    Images handed out by the memory tier are shared between callers and must be
+    treated as read-only. Disk writes are PNG-encoded on a background thread so
+    they stay off the render path; when ``write_queue`` pages are already waiting,
+    further pages are kept in memory only.
+    """
+
+    def __init__(self, memory_bytes: int, disk_dir: str, disk_bytes: int, write_queue: int = 8):
+        self.memory = MemoryLRU(memory_bytes)
+        self.disk = DiskCache(disk_dir, disk_bytes, suffix=".png")
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.skipped_writes = 0
+        self._write_slots = threading.BoundedSemaphore(max(1, write_queue))
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._writer_lock = threading.Lock()
+
+    @staticmethod
+    def key(pdf_hash: str, page: int, dpi: int, colorspace: str = "RGB") -> str:
+        return f"{pdf_hash}_p{page}_d{dpi}_{colorspace}"
+
+    def contains(self, key: str) -> bool:
+        return self.memory.get(key) is not None or os.path.exists(self.disk.path_for(key))
+
+    def get(self, key: str):
+        image = self.memory.get(key)
+        if image is not None:
+            self.hits += 1
+            return image
+        path = self.disk.get_path(key)
+        if path is not None:
+            try:
+                with Image.open(path) as handle:
+                    image = handle.copy()
+            except OSError:
+                self.disk.delete(key)
+            else:
+                self.disk_hits += 1
+                self.memory.put(key, image, _image_nbytes(image))
+                return image
+        self.misses += 1
+        return None
+
+    def put(self, key: str, image, persist: bool = True) -> None:
+        self.memory.put(key, image, _image_nbytes(image))
+        if not persist or self.disk.max_bytes <= 0:
+            return
+        if not self._write_slots.acquire(blocking=False):
+            self.skipped_writes += 1
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="raster-cache-writer"
+                )
+        self._writer.submit(self._write, key, image)
+
+    def _write(self, key: str, image) -> None:
+        try:
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG", compress_level=1)
+            self.disk.put_bytes(key, buffer.getvalue())
+        except OSError:
+            pass
+        finally:
+            self._write_slots.release()
+
+    def flush(self) -> None:
+        """Wait for queued disk writes to finish."""
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats(),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "skipped_writes": self.skipped_writes,
+        }
+
+
+def _image_nbytes(image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+_raster_cache: Optional[RasterCache] = None
+_singletons_lock = threading.Lock()
+
+
+def get_raster_cache() -> RasterCache:
+    global _raster_cache
+    with _singletons_lock:
+        if _raster_cache is None:
+            _raster_cache = RasterCache(
+                memory_bytes=_env_mb("RASTER_CACHE_MEMORY_MB", 1024),
+                disk_dir=os.getenv("RASTER_CACHE_DIR", os.path.join(CACHE_DIR, "rasters")),
+                disk_bytes=_env_mb("RASTER_CACHE_DISK_MB", 8192),
+                write_queue=int(os.getenv("RASTER_CACHE_WRITE_QUEUE", "8")),
+            )
+        return _raster_cache
+
+
+def flush_raster_cache() -> None:
+    """Finish pending raster disk writes, e.g. on shutdown."""
+    with _singletons_lock:
+        raster_cache = _raster_cache
+    if raster_cache is not None:
+        raster_cache.flush()
+
+
+_page_file_cache: Optional[DiskCache] = None
+
+
+def get_page_file_cache() -> DiskCache:
+    """Encoded page images served by the lazy page endpoint."""
+    global _page_file_cache
+    with _singletons_lock:
+        if _page_file_cache is None:
+            _page_file_cache = DiskCache(
+                os.getenv("PAGE_CACHE_DIR", os.path.join(CACHE_DIR, "pages")),
+                _env_mb("PAGE_CACHE_DISK_MB", 2048),
+            )
+        return _page_file_cache
+
+
+_ocr_cache: Optional[DiskCache] = None
+
+
+def get_ocr_cache() -> DiskCache:
+    """Per-page OCR results keyed by raster digest and provider configuration."""
+    global _ocr_cache
+    with _singletons_lock:
+        if _ocr_cache is None:
+            _ocr_cache = DiskCache(
+                os.getenv("OCR_CACHE_DIR", os.path.join(CACHE_DIR, "ocr")),
+                _env_mb("OCR_CACHE_DISK_MB", 512),
+                suffix=".npz",
+            )
+        return _ocr_cache
+
+
+_vlm_cache: Optional[DiskCache] = None
+
+
+def get_vlm_cache() -> DiskCache:
+    """VLM responses keyed by page raster digest, prompt, provider, model and settings."""
+    global _vlm_cache
+    with _singletons_lock:
+        if _vlm_cache is None:
+            _vlm_cache = DiskCache(
+                os.getenv("VLM_CACHE_DIR", os.path.join(CACHE_DIR, "vlm")),
+                _env_mb("VLM_CACHE_DISK_MB", 256),
+                suffix=".json",
+            )
+        return _vlm_cache
@@ -0,0 +1,267 @@
+import math
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Page keys that hold per-item records, with the record field that each column maps to.
+# "label" is only stored for kinds that carry a label next to their text.
+KINDS: Dict[str, Dict[str, str]] = {
+    "words": {"text": "text", "confidence": "confidence", "count": "word_count"},
+    "tokens": {"text": "word", "label": "label", "confidence": "score", "count": "token_count"},
+    "detections": {"text": "label", "confidence": "confidence", "count": "detection_count"},
+}
+
+
+def _pack_strings(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(blob: np.ndarray, offsets: np.ndarray) -> List[str]:
+    data = blob.tobytes()
+    bounds = offsets.tolist()
+    return [data[start:stop].decode("utf-8") for start, stop in zip(bounds, bounds[1:])]
+
+
+class WordTable:
+    """Columnar store for OCR words, layout tokens and detections.
+
+    Text is one UTF-8 blob with int64 row offsets, boxes are an ``(n, 4)`` int32 matrix
+    in pixels and confidences are float32 with NaN for "no score". Records only become
+    dicts again at the API edge via :meth:`to_records`.
+    """
+
+    __slots__ = ("text", "text_offsets", "bbox", "confidence", "label", "label_offsets")
+
+    def __init__(
+        self,
+        text: np.ndarray,
+        text_offsets: np.ndarray,
+        bbox: np.ndarray,
+        confidence: np.ndarray,
+        label: Optional[np.ndarray] = None,
+        label_offsets: Optional[np.ndarray] = None,
+    ):
+        self.text = text
+        self.text_offsets = text_offsets
+        self.bbox = bbox
+        self.confidence = confidence
+        self.label = label
+        self.label_offsets = label_offsets
+
+    def __len__(self) -> int:
+        return int(self.bbox.shape[0])
+
+    @classmethod
+    def from_columns(
+        cls,
+        texts: List[str],
+        boxes: Iterable[Iterable[float]],
+        confidences: Iterable[Optional[float]],
+        labels: Optional[List[str]] = None,
+    ) -> "WordTable":
+        text, text_offsets = _pack_strings(texts)
+        bbox = np.rint(np.asarray(list(boxes), dtype=np.float64).reshape(-1, 4)).astype(np.int32)
+        confidence = np.array(
+            [math.nan if value is None else value for value in confidences], dtype=np.float32
+        )
+        label = label_offsets = None
+        if labels is not None:
+            label, label_offsets = _pack_strings(labels)
+        return cls(text, text_offsets, bbox, confidence, label, label_offsets)
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]], kind: str = "words") -> "WordTable":
+        fields = KINDS[kind]
+        labels = [str(record[fields["label"]]) for record in records] if "label" in fields else None
+        return cls.from_columns(
+            [str(record[fields["text"]]) for record in records],
+            [record["bbox"] for record in records],
+            [record.get(fields["confidence"]) for record in records],
+            labels,
+        )
+
+    @classmethod
+    def empty(cls, kind: str = "words") -> "WordTable":
+        return cls.from_records([], kind)
+
+    @classmethod
+    def concat(cls, tables: List["WordTable"]) -> "WordTable":
+        if not tables:
+            return cls.empty()
+        labeled = tables[0].label is not None
+
+        def join(blobs, offsets):
+            bases = np.cumsum([0] + [len(blob) for blob in blobs[:-1]])
+            merged = [offsets[0][:1]] + [
+                offset[1:] + base for offset, base in zip(offsets, bases)
+            ]
+            return np.concatenate(blobs), np.concatenate(merged)
+
+        text, text_offsets = join(
+            [table.text for table in tables], [table.text_offsets for table in tables]
+        )
+        label = label_offsets = None
+        if labeled:
+            label, label_offsets = join(
+                [table.label for table in tables], [table.label_offsets for table in tables]
+            )
+        return cls(
+            text,
+            text_offsets,
+            np.concatenate([table.bbox for table in tables]),
+            np.concatenate([table.confidence for table in tables]),
+            label,
+            label_offsets,
+        )
+
+    def translate(self, dx: int, dy: int) -> "WordTable":
+        """Return a copy with boxes shifted by ``(dx, dy)``, e.g. from crop to page pixels."""
+        bbox = self.bbox + np.array([dx, dy, dx, dy], dtype=np.int32)
+        return WordTable(
+            self.text, self.text_offsets, bbox, self.confidence, self.label, self.label_offsets
+        )
+
+    def texts(self) -> List[str]:
+        return _unpack_strings(self.text, self.text_offsets)
+
+    def take(self, rows) -> "WordTable":
+        """Return the rows selected by a boolean mask or an index array."""
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        texts = _unpack_strings(self.text, self.text_offsets)
+        text, text_offsets = _pack_strings([texts[row] for row in rows.tolist()])
+        label = label_offsets = None
+        if self.label is not None:
+            labels = _unpack_strings(self.label, self.label_offsets)
+            label, label_offsets = _pack_strings([labels[row] for row in rows.tolist()])
+        return WordTable(
+            text, text_offsets, self.bbox[rows], self.confidence[rows], label, label_offsets
+        )
+
+    def scored(self) -> np.ndarray:
+        return self.confidence[~np.isnan(self.confidence)]
+
+    def to_records(self, kind: str = "words") -> List[Dict[str, Any]]:
+        fields = KINDS[kind]
+        texts = _unpack_strings(self.text, self.text_offsets)
+        labels = (
+            _unpack_strings(self.label, self.label_offsets) if self.label is not None else None
+        )
+        records = []
+        for row, (text, box, score) in enumerate(
+            zip(texts, self.bbox.tolist(), self.confidence.tolist())
+        ):
+            record: Dict[str, Any] = {fields["text"]: text, "bbox": box}
+            if labels is not None and "label" in fields:
+                record[fields["label"]] = labels[row]
+            # float32 scores are rounded so they read back as the values that were stored
+            record[fields["confidence"]] = None if math.isnan(score) else round(score, 6)
+            records.append(record)
+        return records
+
+    def columns(self, prefix: str = "") -> Dict[str, np.ndarray]:
+        arrays = {
+            f"{prefix}text": self.text,
+            f"{prefix}text_offsets": self.text_offsets,
+            f"{prefix}bbox": self.bbox,
+            f"{prefix}confidence": self.confidence,
+        }
+        if self.label is not None:
+            arrays[f"{prefix}label"] = self.label
+            arrays[f"{prefix}label_offsets"] = self.label_offsets
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str = "") -> "WordTable":
+        label_key = f"{prefix}label"
+        has_label = label_key in arrays
+        return cls(
+            arrays[f"{prefix}text"],
+            arrays[f"{prefix}text_offsets"],
+            arrays[f"{prefix}bbox"],
+            arrays[f"{prefix}confidence"],
+            arrays[label_key] if has_label else None,
+            arrays[f"{prefix}label_offsets"] if has_label else None,
+        )
+
+
+def page_records(page: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of one page with its tables turned into records, for streaming it as JSON."""
+    return {
+        name: value.to_records(name) if isinstance(value, WordTable) else value
+        for name, value in page.items()
+    }
+
+
+def pack(output: Dict[str, Any], npz_path: str) -> Dict[str, Any]:
+    """Move every page's word/token/detection tables into one ``.npz`` artifact.
+
+    Pages keep a per-kind count (``word_count``, ``token_count``, ``detection_count``)
+    and the output gains a ``columnar`` entry pointing at the file. Outputs without
+    tables are returned unchanged.
+    """
+    pages = output.get("pages")
+    if not isinstance(pages, list):
+        return output
+
+    by_kind: Dict[str, List[WordTable]] = {}
+    for page in pages:
+        if not isinstance(page, dict):
+            continue
+        for kind, fields in KINDS.items():
+            value = page.get(kind)
+            if value is None:
+                continue
+            table = value if isinstance(value, WordTable) else WordTable.from_records(value, kind)
+            by_kind.setdefault(kind, []).append(table)
+            page.pop(kind)
+            page[fields["count"]] = len(table)
+    if not by_kind:
+        return output
+
+    arrays: Dict[str, np.ndarray] = {}
+    summary: Dict[str, Dict[str, Any]] = {}
+    for kind, tables in by_kind.items():
+        table = WordTable.concat(tables)
+        arrays.update(table.columns(f"{kind}."))
+        scored = table.scored()
+        avg_confidence = float(scored.mean(dtype=np.float64)) if scored.size else None
+        summary[kind] = {
+            "count": len(table),
+            "scored": int(scored.size),
+            "avg_confidence": round(avg_confidence, 6) if scored.size else None,
+        }
+    np.savez_compressed(npz_path, **arrays)
+    output["columnar"] = {"path": npz_path, "tables": summary}
+    return output
+
+
+def expand(output: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Inverse of :meth:`pack`: load the ``.npz`` artifact back into per-page record lists."""
+    if not isinstance(output, dict) or "columnar" not in output:
+        return output
+    columnar = output["columnar"]
+    path = columnar.get("path")
+    if not path or not os.path.exists(path):
+        return output
+
+    pages = [page for page in output.get("pages") or [] if isinstance(page, dict)]
+    with np.load(path) as arrays:
+        for kind in columnar.get("tables", {}):
+            fields = KINDS[kind]
+            records = WordTable.from_arrays(arrays, f"{kind}.").to_records(kind)
+            start = 0
+            for page in pages:
+                if fields["count"] not in page:
+                    continue
+                stop = start + page[fields["count"]]
+                page[kind] = records[start:stop]
+                start = stop
+    return output
+
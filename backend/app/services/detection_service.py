@@ -1,31 +1,32 @@
+import functools
 import os
-from functools import lru_cache
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 import torch
-from pdf2image import convert_from_path
 
-# Poppler path for Windows
-POPPLER_PATH = os.environ.get(
-    "POPPLER_PATH",
-    r"C:\Users\michael.martello\Downloads\poppler-install\poppler-25.07.0\Library\bin"
-)
+from . import model_registry, pdf_service, preprocess_service
+from .columnar_service import WordTable
 
 
-def _run_yolov8(pdf_path: str, targets: Optional[List[str]] = None) -> Dict[str, Any]:
+def _run_yolov8(
+    page_iter,
+    targets: Optional[List[str]] = None,
+    on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
     try:
         from ultralytics import YOLO
     except ImportError as exc:
         raise RuntimeError("ultralytics is not installed.") from exc
 
     model_path = os.getenv("YOLO_MODEL_PATH", "yolov8n.pt")
-    model = YOLO(model_path)
-    images = convert_from_path(pdf_path, dpi=200, poppler_path=POPPLER_PATH)
     target_set = {target.lower() for target in targets or []}
 
     pages = []
-    for page_index, image in enumerate(images, start=1):
-        results = model.predict(source=image, verbose=False)
+    for page_index, image in page_iter:
+        with model_registry.use_model(
+            f"yolov8:{model_path}", lambda: YOLO(model_path)
+        ) as model:
+            results = model.predict(source=image, verbose=False)
         page_detections = []
         for result in results:
             names = result.names or {}
@@ -43,44 +44,64 @@ def _run_yolov8(pdf_path: str, targets: Optional[List[str]] = None) -> Dict[str,
                         "bbox": [x1, y1, x2, y2],
                     }
                 )
-        pages.append({"page": page_index, "detections": page_detections})
+        pages.append(
+            {
+                "page": page_index,
+                "width": image.width,
+                "height": image.height,
+                "detections": WordTable.from_records(page_detections, "detections"),
+            }
+        )
+        if on_page:
+            on_page(pages[-1])
     return {"provider": "yolov8", "pages": pages}
 
 
-@lru_cache(maxsize=1)
 def _load_grounding_dino():
+    """Return ``(use, model_name)``; ``with use() as (processor, model)`` holds the model."""
+    model_name = os.getenv(
+        "GROUNDING_DINO_MODEL", "IDEA-Research/grounding-dino-base"
+    )
+    use = functools.partial(
+        model_registry.use_model,
+        f"grounding_dino:{model_name}",
+        lambda: _build_grounding_dino(model_name),
+    )
+    return use, model_name
+
+
+def _build_grounding_dino(model_name: str):
     try:
         from transformers import GroundingDinoForObjectDetection, GroundingDinoProcessor
     except ImportError as exc:
         raise RuntimeError("transformers is not installed.") from exc
 
-    model_name = os.getenv(
-        "GROUNDING_DINO_MODEL", "IDEA-Research/grounding-dino-base"
-    )
     processor = GroundingDinoProcessor.from_pretrained(model_name)
     model = GroundingDinoForObjectDetection.from_pretrained(model_name)
     model.eval()
-    return processor, model, model_name
+    return processor, model
 
 
 def _run_grounding_dino(
-    pdf_path: str, targets: Optional[List[str]] = None
+    page_iter,
+    targets: Optional[List[str]] = None,
+    on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
 ) -> Dict[str, Any]:
     if not targets:
         raise RuntimeError("Grounding DINO requires target labels.")
-    processor, model, model_name = _load_grounding_dino()
-    images = convert_from_path(pdf_path, dpi=200, poppler_path=POPPLER_PATH)
+    use, model_name = _load_grounding_dino()
     query = ". ".join(targets)
 
     pages = []
-    for page_index, image in enumerate(images, start=1):
-        inputs = processor(images=image, text=query, return_tensors="pt")
-        with torch.no_grad():
-            outputs = model(**inputs)
-        target_sizes = torch.tensor([[image.height, image.width]])
-        results = processor.post_process_grounded_object_detection(
-            outputs, target_sizes=target_sizes, box_threshold=0.25, text_threshold=0.25
-        )
+    for page_index, image in page_iter:
+        with use() as (processor, model):
+            inputs = processor(images=image, text=query, return_tensors="pt")
+            with torch.no_grad():
+                outputs = model(**inputs)
+            target_sizes = torch.tensor([[image.height, image.width]])
+            results = processor.post_process_grounded_object_detection(
+                outputs, target_sizes=target_sizes, box_threshold=0.25, text_threshold=0.25
+            )
         detections = []
         for box, score, label in zip(
             results[0]["boxes"], results[0]["scores"], results[0]["labels"]
@@ -93,7 +114,16 @@ def _run_grounding_dino(
                     "bbox": [x1, y1, x2, y2],
                 }
             )
-        pages.append({"page": page_index, "detections": detections})
+        pages.append(
+            {
+                "page": page_index,
+                "width": image.width,
+                "height": image.height,
+                "detections": WordTable.from_records(detections, "detections"),
+            }
+        )
+        if on_page:
+            on_page(pages[-1])
     return {"provider": "grounding_dino", "model": model_name, "pages": pages}
 
 
@@ -101,10 +131,52 @@ def run_detection(
     pdf_path: str,
     provider: str,
     targets: Optional[List[str]] = None,
+    pages: Optional[List[int]] = None,
+    dpi: Optional[int] = None,
+    max_edge: Optional[int] = None,
+    preprocess: Optional[List[str]] = None,
+    on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
 ) -> Dict[str, Any]:
     provider_key = provider.lower().strip()
     if provider_key == "yolov8":
-        return _run_yolov8(pdf_path, targets=targets)
-    if provider_key == "grounding_dino":
-        return _run_grounding_dino(pdf_path, targets=targets)
-    raise RuntimeError(f"Unknown detection provider '{provider}'.")
+        runner = _run_yolov8
+    elif provider_key == "grounding_dino":
+        runner = _run_grounding_dino
+    else:
+        raise RuntimeError(f"Unknown detection provider '{provider}'.")
+
+    profile = pdf_service.render_profile(provider_key, dpi, max_edge)
+    dpis = pdf_service.page_dpis(pdf_path, profile["dpi"], profile["max_edge"], pages)
+    page_iter = pdf_service.iter_pages(
+        pdf_path, dpi=profile["dpi"], max_edge=profile["max_edge"], pages=list(dpis)
+    )
+
+    def finish(page: Dict[str, Any]) -> None:
+        page["page_dpi"] = dpis[page["page"]]
+        if on_page:
+            on_page(page)
+
+    steps = preprocess_service.parse_steps(preprocess)
+    if not steps:
+        output = runner(page_iter, targets=targets, on_page=finish)
+        output["render"] = {**profile, "page_dpi": dpis}
+        return output
+
+    transforms: Dict[int, preprocess_service.Transform] = {}
+    stats: Dict[str, Any] = {}
+
+    def restore(page: Dict[str, Any]) -> None:
+        transform = transforms.pop(page["page"])
+        page["detections"] = transform.map_table(page["detections"])
+        page["width"], page["height"] = transform.size
+        finish(page)
+
+    output = runner(
+        preprocess_service.preprocess_pages(page_iter, steps, transforms, stats, "RGB"),
+        targets=targets,
+        on_page=restore,
+    )
+    output["render"] = {**profile, "page_dpi": dpis}
+    output["preprocess"] = steps
+    output["metrics"] = stats
+    return output
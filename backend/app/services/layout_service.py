@@ -1,32 +1,37 @@
+import functools
 import os
-from functools import lru_cache
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional
 
 import torch
-from pdf2image import convert_from_path
 
-# Poppler path for Windows
-POPPLER_PATH = os.environ.get(
-    "POPPLER_PATH",
-    r"C:\Users\michael.martello\Downloads\poppler-install\poppler-25.07.0\Library\bin"
-)
+from . import model_registry, pdf_service
+from .columnar_service import WordTable
 
 
-@lru_cache(maxsize=1)
 def _load_layoutlmv3():
+    """Return ``(use, model_name)``; ``with use() as (processor, model)`` holds the model."""
+    model_name = os.getenv(
+        "LAYOUTLMV3_MODEL",
+        "microsoft/layoutlmv3-base-finetuned-funsd",
+    )
+    use = functools.partial(
+        model_registry.use_model,
+        f"layoutlmv3:{model_name}",
+        lambda: _build_layoutlmv3(model_name),
+    )
+    return use, model_name
+
+
+def _build_layoutlmv3(model_name: str):
     try:
         from transformers import LayoutLMv3ForTokenClassification, LayoutLMv3Processor
     except ImportError as exc:
         raise RuntimeError("transformers is not installed.") from exc
 
-    model_name = os.getenv(
-        "LAYOUTLMV3_MODEL",
-        "microsoft/layoutlmv3-base-finetuned-funsd",
-    )
     processor = LayoutLMv3Processor.from_pretrained(model_name)
     model = LayoutLMv3ForTokenClassification.from_pretrained(model_name)
     model.eval()
-    return processor, model, model_name
+    return processor, model
 
 
 def _ocr_words(image) -> Dict[str, List[Any]]:
@@ -62,30 +67,54 @@ def _normalize_boxes(boxes: List[List[int]], width: int, height: int) -> List[Li
     return normalized
 
 
-def run_layout(pdf_path: str, provider: str) -> Dict[str, Any]:
+def run_layout(
+    pdf_path: str,
+    provider: str,
+    pages: Optional[List[int]] = None,
+    dpi: Optional[int] = None,
+    max_edge: Optional[int] = None,
+    on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
     provider_key = provider.lower().strip()
     if provider_key != "layoutlmv3":
         raise RuntimeError(f"Unknown layout provider '{provider}'.")
 
-    processor, model, model_name = _load_layoutlmv3()
-    images = convert_from_path(pdf_path, dpi=200, poppler_path=POPPLER_PATH)
+    use, model_name = _load_layoutlmv3()
+    profile = pdf_service.render_profile(provider_key, dpi, max_edge)
+    dpis = pdf_service.page_dpis(pdf_path, profile["dpi"], profile["max_edge"], pages)
+    page_iter = pdf_service.iter_pages(
+        pdf_path, dpi=profile["dpi"], max_edge=profile["max_edge"], pages=list(dpis)
+    )
 
     pages = []
-    for page_index, image in enumerate(images, start=1):
+    for page_index, image in page_iter:
         ocr = _ocr_words(image)
         if not ocr["words"]:
-            pages.append({"page": page_index, "tokens": [], "note": "No OCR tokens."})
+            pages.append(
+                {
+                    "page": page_index,
+                    "width": image.width,
+                    "height": image.height,
+                    "page_dpi": dpis[page_index],
+                    "tokens": WordTable.empty("tokens"),
+                    "note": "No OCR tokens.",
+                }
+            )
+            if on_page:
+                on_page(pages[-1])
             continue
         norm_boxes = _normalize_boxes(ocr["boxes"], image.width, image.height)
-        encoding = processor(
-            image,
-            ocr["words"],
-            boxes=norm_boxes,
-            return_tensors="pt",
-            truncation=True,
-        )
-        with torch.no_grad():
-            outputs = model(**encoding)
+        with use() as (processor, model):
+            encoding = processor(
+                image,
+                ocr["words"],
+                boxes=norm_boxes,
+                return_tensors="pt",
+                truncation=True,
+            )
+            with torch.no_grad():
+                outputs = model(**encoding)
+            id2label = model.config.id2label
         logits = outputs.logits[0]
         probs = torch.softmax(logits, dim=-1)
         word_ids = encoding.word_ids()
@@ -97,7 +126,7 @@ def run_layout(pdf_path: str, provider: str) -> Dict[str, Any]:
             seen.add(word_id)
             label_id = int(torch.argmax(logits[idx]).item())
             score = float(probs[idx][label_id].item())
-            label = model.config.id2label.get(label_id, str(label_id))
+            label = id2label.get(label_id, str(label_id))
             tokens.append(
                 {
                     "word": ocr["words"][word_id],
@@ -109,9 +138,19 @@ def run_layout(pdf_path: str, provider: str) -> Dict[str, Any]:
         pages.append(
             {
                 "page": page_index,
+                "width": image.width,
+                "height": image.height,
+                "page_dpi": dpis[page_index],
                 "token_count": len(tokens),
-                "tokens": tokens,
+                "tokens": WordTable.from_records(tokens, "tokens"),
             }
         )
+        if on_page:
+            on_page(pages[-1])
 
-    return {"provider": provider_key, "model": model_name, "pages": pages}
+    return {
+        "provider": provider_key,
+        "model": model_name,
+        "render": {**profile, "page_dpi": dpis},
+        "pages": pages,
+    }
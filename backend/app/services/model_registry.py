@@ -0,0 +1,150 @@
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+MODEL_REGISTRY_BUDGET_MB = int(os.getenv("MODEL_REGISTRY_BUDGET_MB", "8192"))
+
+
+def _resident_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm", "r", encoding="ascii") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+class _Entry:
+    __slots__ = (
+        "model", "load_ms", "size_bytes", "loaded_at", "last_used", "uses", "refs", "lock"
+    )
+
+    def __init__(self, model: Any, load_ms: int, size_bytes: int):
+        self.model = model
+        self.load_ms = load_ms
+        self.size_bytes = size_bytes
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.uses = 0
+        # Callers inside use(); an entry with refs is never evicted.
+        self.refs = 0
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded models, evicted least-recently-used over a memory budget.
+
+    Resident size is measured as the growth in process RSS while the loader runs, so
+    loads are serialized to keep the measurement attributable to one model.
+    Models are handed out through :meth:`use`, which serializes calls into each model
+    (the OCR and detection libraries are not thread-safe) and keeps it from being
+    evicted while a call is running.
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    @contextmanager
+    def use(self, key: str, loader: Callable[[], Any]) -> Iterator[Any]:
+        """Yield the model for ``key``, loading it if needed, with exclusive use of it."""
+        entry = self._acquire(key, loader)
+        try:
+            with entry.lock:
+                yield entry.model
+        finally:
+            with self._lock:
+                entry.refs -= 1
+
+    def _acquire(self, key: str, loader: Callable[[], Any]) -> _Entry:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return self._touch(key, entry)
+        with self._load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    return self._touch(key, entry)
+            rss_before = _resident_bytes()
+            start = time.perf_counter()
+            model = loader()
+            load_ms = int((time.perf_counter() - start) * 1000)
+            rss_after = _resident_bytes()
+            size_bytes = 0
+            if rss_before is not None and rss_after is not None:
+                size_bytes = max(0, rss_after - rss_before)
+            with self._lock:
+                entry = _Entry(model, load_ms, size_bytes)
+                self._entries[key] = entry
+                self._evict(keep=key)
+                return self._touch(key, entry)
+
+    def _touch(self, key: str, entry: _Entry) -> _Entry:
+        self._entries.move_to_end(key)
+        entry.last_used = time.time()
+        entry.uses += 1
+        entry.refs += 1
+        return entry
+
+    def _evict(self, keep: str) -> None:
+        total = sum(entry.size_bytes for entry in self._entries.values())
+        evicted = False
+        for key in list(self._entries):
+            if total <= self.budget_bytes:
+                break
+            if key == keep or self._entries[key].refs:
+                continue
+            total -= self._entries.pop(key).size_bytes
+            evicted = True
+        if evicted:
+            gc.collect()
+
+    def evict(self, key: str) -> bool:
+        """Drop a model unless a call into it is running. Returns whether it was removed."""
+        with self._lock:
+            entry = self._entries.get(key)
+            removed = entry is not None and not entry.refs
+            if removed:
+                del self._entries[key]
+        if removed:
+            gc.collect()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models: List[Dict[str, Any]] = [
+                {
+                    "key": key,
+                    "load_ms": entry.load_ms,
+                    "size_bytes": entry.size_bytes,
+                    "loaded_at": entry.loaded_at,
+                    "last_used": entry.last_used,
+                    "uses": entry.uses,
+                    "in_use": entry.refs,
+                }
+                for key, entry in self._entries.items()
+            ]
+        return {
+            "budget_bytes": self.budget_bytes,
+            "resident_bytes": sum(model["size_bytes"] for model in models),
+            "models": models,
+        }
+
+
+REGISTRY = ModelRegistry(MODEL_REGISTRY_BUDGET_MB * 1024 * 1024)
+
+
+def use_model(key: str, loader: Callable[[], Any]):
+    """Context manager holding the model for ``key`` for the duration of one call."""
+    return REGISTRY.use(key, loader)
@@ -1,14 +1,51 @@
+import csv
+import functools
+import hashlib
+import io
+import json
+import math
 import os
+import subprocess
 import time
-from typing import Any, Dict, List, Optional
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
 
-from pdf2image import convert_from_path
+import fitz
+import numpy as np
 
-# Poppler path for Windows
-POPPLER_PATH = os.environ.get(
-    "POPPLER_PATH",
-    r"C:\Users\michael.martello\Downloads\poppler-install\poppler-25.07.0\Library\bin"
-)
+from . import cache_service, model_registry, pdf_service, preprocess_service
+from .columnar_service import WordTable
+
+# Embedded images smaller than this fraction of the page are not worth a raster OCR pass.
+MIN_REGION_FRACTION = 0.01
+# Parallel tesseract processes; defaults to the number of cores.
+TESSERACT_WORKERS = int(os.getenv("TESSERACT_WORKERS", "0")) or os.cpu_count() or 1
+TESSERACT_OMP_THREAD_LIMIT = os.getenv("TESSERACT_OMP_THREAD_LIMIT", "1")
+SURYA_BATCH_SIZE = int(os.getenv("SURYA_BATCH_SIZE", "4"))
+
+# Distribution that versions each raster provider, and the settings it is loaded with.
+# Both go into the page cache key so an upgrade or config change misses the cache.
+_PROVIDER_PACKAGES = {
+    "tesseract": "pytesseract",
+    "easyocr": "easyocr",
+    "paddleocr": "paddleocr",
+    "surya": "surya-ocr",
+}
+_PROVIDER_CONFIG: Dict[str, Dict[str, Any]] = {
+    "easyocr": {"lang": ["en"], "gpu": False},
+    "paddleocr": {"lang": "en", "use_angle_cls": True},
+}
+
+# Sheet zones as [x0, y0, x1, y1] fractions of the page, for a landscape sheet with the
+# title block strip down the right-hand edge. OCR_ZONES (JSON) overrides or adds zones.
+ZONE_PRESETS: Dict[str, List[float]] = {
+    "title_block": [0.78, 0.75, 1.0, 1.0],
+    "revision_table": [0.78, 0.55, 1.0, 0.75],
+    "general_notes": [0.78, 0.0, 1.0, 0.55],
+    "drawing_area": [0.0, 0.0, 0.78, 1.0],
+}
+ZONE_PRESETS.update(json.loads(os.getenv("OCR_ZONES", "{}")))
 
 
 def _parse_confidence(value: str) -> Optional[float]:
@@ -23,55 +60,133 @@ def _parse_confidence(value: str) -> Optional[float]:
     return score
 
 
-def _run_tesseract(images) -> List[Dict[str, Any]]:
+def _tesseract_data(pytesseract, image, env: Optional[Dict[str, str]] = None) -> Dict[str, list]:
+    """``image_to_data`` as a dict, run with ``env`` when one is given.
+
+    pytesseract always starts tesseract with the process environment, so a per-call
+    environment means running the CLI directly and reading its TSV the same way.
+    """
+    if env is None:
+        return pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    try:
+        completed = subprocess.run(
+            [pytesseract.pytesseract.tesseract_cmd, "stdin", "stdout", "tsv"],
+            input=buffer.getvalue(),
+            capture_output=True,
+            env=env,
+        )
+    except FileNotFoundError as exc:
+        raise RuntimeError("tesseract is not installed or not on PATH.") from exc
+    if completed.returncode:
+        message = completed.stderr.decode("utf-8", "replace").strip()
+        raise RuntimeError(f"tesseract failed: {message}")
+    rows = csv.reader(
+        io.StringIO(completed.stdout.decode("utf-8", "replace")),
+        delimiter="\t",
+        quoting=csv.QUOTE_NONE,
+    )
+    header = next(rows, [])
+    data: Dict[str, list] = {column: [] for column in header}
+    for row in rows:
+        for column, value in zip(header, row + [""] * (len(header) - len(row))):
+            if column != "text" and value.lstrip("-").isdigit():
+                value = int(value)
+            data[column].append(value)
+    return data
+
+
+def _tesseract_page(
+    pytesseract, index: int, image, env: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    data = _tesseract_data(pytesseract, image, env)
+    words = []
+    for text, x, y, w, h, conf in zip(
+        data.get("text", []),
+        data.get("left", []),
+        data.get("top", []),
+        data.get("width", []),
+        data.get("height", []),
+        data.get("conf", []),
+    ):
+        if not text or not text.strip():
+            continue
+        words.append(
+            {
+                "text": text.strip(),
+                "bbox": [x, y, x + w, y + h],
+                "confidence": _parse_confidence(conf),
+            }
+        )
+    return {
+        "page": index,
+        "width": image.width,
+        "height": image.height,
+        "words": WordTable.from_records(words),
+    }
+
+
+def _run_tesseract(
+    pages,
+    workers: Optional[int] = None,
+    on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> List[Dict[str, Any]]:
+    """OCR pages with tesseract, fanning them out over ``workers`` threads.
+
+    Each pytesseract call runs a separate tesseract process, so threads are enough to
+    keep every core busy. At most ``2 * workers`` pages are in flight, and results
+    come back in page order.
+    """
     try:
         import pytesseract
     except ImportError as exc:
         raise RuntimeError("pytesseract is not installed.") from exc
 
     results = []
-    for index, image in enumerate(images, start=1):
-        data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
-        words = []
-        for text, x, y, w, h, conf in zip(
-            data.get("text", []),
-            data.get("left", []),
-            data.get("top", []),
-            data.get("width", []),
-            data.get("height", []),
-            data.get("conf", []),
-        ):
-            if not text or not text.strip():
-                continue
-            words.append(
-                {
-                    "text": text.strip(),
-                    "bbox": [x, y, x + w, y + h],
-                    "confidence": _parse_confidence(conf),
-                }
-            )
-        results.append(
-            {
-                "page": index,
-                "width": image.width,
-                "height": image.height,
-                "words": words,
-            }
-        )
+
+    def collect(result: Dict[str, Any]) -> None:
+        results.append(result)
+        if on_page:
+            on_page(result)
+
+    workers = max(1, workers or TESSERACT_WORKERS)
+    if workers == 1:
+        for index, image in pages:
+            collect(_tesseract_page(pytesseract, index, image))
+        return results
+
+    # One OpenMP thread per tesseract process; parallelism comes from the pool. The
+    # limit goes into each process's environment rather than this one's.
+    env = {**os.environ, "OMP_THREAD_LIMIT": TESSERACT_OMP_THREAD_LIMIT}
+    pending: Deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for index, image in pages:
+            pending.append(executor.submit(_tesseract_page, pytesseract, index, image, env))
+            image = None
+            if len(pending) >= workers * 2:
+                collect(pending.popleft().result())
+        while pending:
+            collect(pending.popleft().result())
     return results
 
 
-def _run_easyocr(images) -> List[Dict[str, Any]]:
+def _run_easyocr(
+    pages, on_page: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> List[Dict[str, Any]]:
     try:
         import easyocr
     except ImportError as exc:
         raise RuntimeError("easyocr is not installed.") from exc
 
-    reader = easyocr.Reader(["en"], gpu=False)
     results = []
-    for index, image in enumerate(images, start=1):
+    for index, image in pages:
         page_words = []
-        for bbox, text, conf in reader.readtext(image):
+        with model_registry.use_model(
+            "easyocr:en", lambda: easyocr.Reader(["en"], gpu=False)
+        ) as reader:
+            lines = reader.readtext(image)
+        for bbox, text, conf in lines:
             if not text or not text.strip():
                 continue
             xs = [point[0] for point in bbox]
@@ -88,27 +203,29 @@ def _run_easyocr(images) -> List[Dict[str, Any]]:
                 "page": index,
                 "width": image.width,
                 "height": image.height,
-                "words": page_words,
+                "words": WordTable.from_records(page_words),
             }
         )
+        if on_page:
+            on_page(results[-1])
     return results
 
 
-def _run_paddleocr(images) -> List[Dict[str, Any]]:
-    try:
-        import numpy as np
-    except ImportError as exc:
-        raise RuntimeError("numpy is required for paddleocr.") from exc
+def _run_paddleocr(
+    pages, on_page: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> List[Dict[str, Any]]:
     try:
         from paddleocr import PaddleOCR
     except ImportError as exc:
         raise RuntimeError("paddleocr is not installed.") from exc
 
-    ocr = PaddleOCR(use_angle_cls=True, lang="en")
     results = []
-    for index, image in enumerate(images, start=1):
+    for index, image in pages:
         page_words = []
-        ocr_result = ocr.ocr(np.array(image), cls=True)
+        with model_registry.use_model(
+            "paddleocr:en", lambda: PaddleOCR(use_angle_cls=True, lang="en")
+        ) as ocr:
+            ocr_result = ocr.ocr(np.array(image), cls=True)
         for line in ocr_result or []:
             for box, (text, conf) in line:
                 if not text or not text.strip():
@@ -127,55 +244,76 @@ def _run_paddleocr(images) -> List[Dict[str, Any]]:
                 "page": index,
                 "width": image.width,
                 "height": image.height,
-                "words": page_words,
+                "words": WordTable.from_records(page_words),
             }
         )
+        if on_page:
+            on_page(results[-1])
     return results
 
 
-def _run_surya(images) -> List[Dict[str, Any]]:
+def _run_surya(
+    pages,
+    batch_size: Optional[int] = None,
+    on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> List[Dict[str, Any]]:
+    """Run Surya detection and recognition over batches of ``batch_size`` pages."""
     try:
         from surya.model.recognition import RecognitionPredictor
         from surya.model.detection import DetectionPredictor
     except ImportError as exc:
         raise RuntimeError("surya-ocr is not installed.") from exc
-    try:
-        import numpy as np
-    except ImportError as exc:
-        raise RuntimeError("numpy is required for surya.") from exc
 
-    det = DetectionPredictor()
-    rec = RecognitionPredictor()
+    batch_size = max(1, batch_size or SURYA_BATCH_SIZE)
     results = []
-    for index, image in enumerate(images, start=1):
-        img_np = np.array(image)
-        det_results = det([img_np])
-        rec_results = rec([img_np], det_results)
-        page_words = []
-        for line in rec_results[0]:
-            text = getattr(line, "text", None)
-            if not text or not text.strip():
-                continue
-            bbox = getattr(line, "bbox", None) or getattr(line, "polygon", None)
-            confidence = getattr(line, "confidence", None)
-            if bbox:
-                xs = [point[0] for point in bbox]
-                ys = [point[1] for point in bbox]
-                page_words.append(
-                    {
-                        "text": text.strip(),
-                        "bbox": [min(xs), min(ys), max(xs), max(ys)],
-                        "confidence": float(confidence) if confidence is not None else None,
-                    }
-                )
-        results.append(
-            {
-                "page": index,
-                "width": image.width,
-                "height": image.height,
-                "words": page_words,
-            }
-        )
+    batch: List[Tuple[int, Any]] = []
+
+    def flush() -> None:
+        arrays = [np.array(image) for _, image in batch]
+        with model_registry.use_model("surya:detection", DetectionPredictor) as det:
+            det_results = det(arrays)
+        with model_registry.use_model("surya:recognition", RecognitionPredictor) as rec:
+            rec_results = rec(arrays, det_results)
+        arrays = None
+        for (index, image), lines in zip(batch, rec_results):
+            page_words = []
+            for line in lines:
+                text = getattr(line, "text", None)
+                if not text or not text.strip():
+                    continue
+                bbox = getattr(line, "bbox", None) or getattr(line, "polygon", None)
+                confidence = getattr(line, "confidence", None)
+                if bbox:
+                    xs = [point[0] for point in bbox]
+                    ys = [point[1] for point in bbox]
+                    page_words.append(
+                        {
+                            "text": text.strip(),
+                            "bbox": [min(xs), min(ys), max(xs), max(ys)],
+                            "confidence": float(confidence) if confidence is not None else None,
+                        }
+                    )
+            results.append(
+                {
+                    "page": index,
+                    "width": image.width,
+                    "height": image.height,
+                    "words": WordTable.from_records(page_words),
+                }
+            )
+            if on_page:
+                on_page(results[-1])
+        batch.clear()
+
+    # Pages are pulled from the stream one batch at a time, so at most batch_size
+    # rasters are alive at once.
+    for index, image in pages:
+        batch.append((index, image))
+        image = None
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
     return results
 
 
@@ -184,39 +322,604 @@ def _run_placeholder(provider: str) -> List[Dict[str, Any]]:
 
 
 def _summarize(pages: List[Dict[str, Any]]) -> Dict[str, Any]:
-    total_words = 0
-    confidences: List[float] = []
-    for page in pages:
-        for word in page.get("words", []):
-            total_words += 1
-            score = word.get("confidence")
-            if score is not None:
-                confidences.append(score)
-    avg_conf = sum(confidences) / len(confidences) if confidences else None
+    total_words = sum(len(page["words"]) for page in pages)
+    scored = [page["words"].scored() for page in pages]
+    confidences = np.concatenate(scored) if scored else np.empty(0, dtype=np.float32)
+    # Rounded like the columnar summary, so float32 scores read back as stored.
+    avg_conf = round(float(confidences.mean(dtype=np.float64)), 6) if confidences.size else None
     return {"page_count": len(pages), "word_count": total_words, "avg_confidence": avg_conf}
 
 
-def run_ocr(pdf_path: str, provider: str, dpi: int = 200) -> Dict[str, Any]:
+def _raster_rect(page, rect) -> fitz.Rect:
+    """Map an unrotated page-space rect to the page as rendered, i.e. after ``/Rotate``."""
+    return fitz.Rect(rect) * page.rotation_matrix
+
+
+def _native_words(page, scale: float) -> WordTable:
+    texts = []
+    boxes = []
+    for x0, y0, x1, y1, text, *_ in page.get_text("words"):
+        if not text or not text.strip():
+            continue
+        texts.append(text.strip())
+        boxes.append([value * scale for value in _raster_rect(page, (x0, y0, x1, y1))])
+    return WordTable.from_columns(texts, boxes, [None] * len(texts))
+
+
+def _run_native(
+    pdf_path: str,
+    dpis: Dict[int, int],
+    on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> List[Dict[str, Any]]:
+    """Read words straight from the PDF text layer, scaled to raster pixels at each page's dpi."""
+    results = []
+    doc = fitz.open(pdf_path)
+    try:
+        for number in sorted(dpis):
+            page = doc[number - 1]
+            scale = dpis[number] / 72.0
+            results.append(
+                {
+                    "page": page.number + 1,
+                    "width": int(round(page.rect.width * scale)),
+                    "height": int(round(page.rect.height * scale)),
+                    "words": _native_words(page, scale),
+                    "source": "native",
+                }
+            )
+            if on_page:
+                on_page(results[-1])
+    finally:
+        doc.close()
+    return results
+
+
+def _textless_image_regions(page, words: WordTable, scale: float) -> List[List[int]]:
+    """Raster pixel boxes of embedded images large enough to matter that hold no native words."""
+    min_area = page.rect.width * page.rect.height * MIN_REGION_FRACTION
+    centers_x = (words.bbox[:, 0] + words.bbox[:, 2]) / 2
+    centers_y = (words.bbox[:, 1] + words.bbox[:, 3]) / 2
+    regions = []
+    for info in page.get_image_info():
+        rect = _raster_rect(page, info["bbox"]) & page.rect
+        if rect.is_empty or rect.width * rect.height < min_area:
+            continue
+        x0, y0, x1, y1 = (value * scale for value in rect)
+        has_text = bool(
+            np.any((centers_x >= x0) & (centers_x <= x1) & (centers_y >= y0) & (centers_y <= y1))
+        )
+        if not has_text:
+            regions.append([int(x0), int(y0), int(x1 + 0.5), int(y1 + 0.5)])
+    return regions
+
+
+def parse_regions(
+    regions: Optional[List[Union[str, List[float]]]],
+) -> Optional[List[Dict[str, Any]]]:
+    """Resolve zone preset names and fractional ``[x0, y0, x1, y1]`` boxes.
+
+    Raises ValueError for unknown zones or malformed boxes.
+    """
+    if not regions:
+        return None
+    resolved = []
+    for region in regions:
+        if isinstance(region, str):
+            name = region.lower().strip()
+            if name not in ZONE_PRESETS:
+                known = ", ".join(sorted(ZONE_PRESETS))
+                raise ValueError(f"Unknown zone '{region}'. Use one of: {known}.")
+            resolved.append({"zone": name, "bbox": [float(v) for v in ZONE_PRESETS[name]]})
+            continue
+        if len(region) != 4:
+            raise ValueError(f"Region {region} must be [x0, y0, x1, y1].")
+        x0, y0, x1, y1 = (float(value) for value in region)
+        if not (0 <= x0 < x1 <= 1 and 0 <= y0 < y1 <= 1):
+            raise ValueError(f"Region {region} must be page fractions with x0 < x1 and y0 < y1.")
+        resolved.append({"zone": None, "bbox": [x0, y0, x1, y1]})
+    return resolved
+
+
+def _zone_boxes(zones: List[Dict[str, Any]], width: int, height: int) -> List[List[int]]:
+    """Pixel boxes of fractional zones on a ``width`` x ``height`` raster."""
+    boxes = []
+    for zone in zones:
+        x0, y0, x1, y1 = zone["bbox"]
+        boxes.append(
+            [
+                int(x0 * width),
+                int(y0 * height),
+                min(width, math.ceil(x1 * width)),
+                min(height, math.ceil(y1 * height)),
+            ]
+        )
+    return boxes
+
+
+def _clip_boxes(boxes: List[List[int]], clips: List[List[int]]) -> List[List[int]]:
+    clipped = []
+    for x0, y0, x1, y1 in boxes:
+        for cx0, cy0, cx1, cy1 in clips:
+            box = [max(x0, cx0), max(y0, cy0), min(x1, cx1), min(y1, cy1)]
+            if box[0] < box[2] and box[1] < box[3]:
+                clipped.append(box)
+    return clipped
+
+
+def _words_in_boxes(words: WordTable, boxes: List[List[int]]) -> WordTable:
+    """Keep the words whose centre falls inside any of ``boxes``."""
+    centers_x = (words.bbox[:, 0] + words.bbox[:, 2]) / 2
+    centers_y = (words.bbox[:, 1] + words.bbox[:, 3]) / 2
+    keep = np.zeros(len(words), dtype=bool)
+    for x0, y0, x1, y1 in boxes:
+        keep |= (centers_x >= x0) & (centers_x <= x1) & (centers_y >= y0) & (centers_y <= y1)
+    return words if keep.all() else words.take(keep)
+
+
+def _ocr_crops(
+    runner: Callable[..., List[Dict[str, Any]]],
+    page_stream,
+    regions_for: Callable[[int, Any], List[List[int]]],
+    on_merged: Optional[Callable[[int, Tuple[int, int], WordTable], None]] = None,
+) -> Dict[int, Tuple[Tuple[int, int], WordTable]]:
+    """OCR pixel regions of streamed pages and map their words back to page pixels.
+
+    ``regions_for(page, image)`` returns the boxes to crop; a box covering the whole
+    raster is passed through uncropped. ``on_merged(page, (width, height), words)``
+    is called as soon as all of a page's crops are OCRed. Returns
+    ``{page: ((width, height), words)}`` for every page that had at least one region.
+    """
+    # job key -> (page number, region offset)
+    jobs: Dict[int, Tuple[int, Tuple[int, int]]] = {}
+    sizes: Dict[int, Tuple[int, int]] = {}
+    remaining: Dict[int, int] = {}
+    words_by_page: Dict[int, List[WordTable]] = {}
+    merged: Dict[int, Tuple[Tuple[int, int], WordTable]] = {}
+    next_key = 0
+
+    def raster_jobs():
+        nonlocal next_key
+        for number, image in page_stream:
+            page_box = [0, 0, *image.size]
+            regions = _clip_boxes(regions_for(number, image), [page_box])
+            if regions:
+                sizes[number] = image.size
+                remaining[number] = len(regions)
+            for region in regions:
+                next_key += 1
+                jobs[next_key] = (number, (region[0], region[1]))
+                if region == page_box:
+                    yield next_key, image
+                else:
+                    yield next_key, image.crop(region)
+            image = None
+
+    def collect(raster: Dict[str, Any]) -> None:
+        number, (offset_x, offset_y) = jobs.pop(raster["page"])
+        words = raster["words"]
+        if offset_x or offset_y:
+            words = words.translate(offset_x, offset_y)
+        words_by_page.setdefault(number, []).append(words)
+        remaining[number] -= 1
+        if remaining[number]:
+            return
+        del remaining[number]
+        merged[number] = (sizes.pop(number), WordTable.concat(words_by_page.pop(number)))
+        if on_merged:
+            on_merged(number, *merged[number])
+
+    runner(raster_jobs(), on_page=collect)
+    return merged
+
+
+def _run_zones(
+    page_stream,
+    runner: Callable[..., List[Dict[str, Any]]],
+    zones: List[Dict[str, Any]],
+    on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> List[Dict[str, Any]]:
+    """Raster OCR only the given zones of each page, in page pixel coordinates."""
+    pages = []
+
+    def merged(number: int, size: Tuple[int, int], words: WordTable) -> None:
+        width, height = size
+        pages.append(
+            {
+                "page": number,
+                "width": width,
+                "height": height,
+                "words": words,
+                "regions": _zone_boxes(zones, width, height),
+            }
+        )
+        if on_page:
+            on_page(pages[-1])
+
+    _ocr_crops(runner, page_stream, lambda number, image: _zone_boxes(zones, *image.size), merged)
+    return sorted(pages, key=lambda result: result["page"])
+
+
+def _run_auto(
+    pdf_path: str,
+    profile: Dict[str, Optional[int]],
+    dpis: Dict[int, int],
+    runner: Callable[..., List[Dict[str, Any]]],
+    zones: Optional[List[Dict[str, Any]]] = None,
+    on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> List[Dict[str, Any]]:
+    """Use the text layer where it exists and raster OCR only the pages/regions without it.
+
+    With ``zones``, native words outside them are dropped and only the parts of
+    textless pages/images that fall inside them are rasterized. Pages that need no
+    raster pass are finished straight from the text layer; the others once their
+    crops are merged.
+    """
+    regions_by_page: Dict[int, List[List[int]]] = {}
+    textless = set()
+    doc = fitz.open(pdf_path)
+
+    def plan(result: Dict[str, Any]) -> None:
+        page_box = [0, 0, result["width"], result["height"]]
+        zone_boxes = _zone_boxes(zones, result["width"], result["height"]) if zones else None
+        if zone_boxes:
+            result["words"] = _words_in_boxes(result["words"], zone_boxes)
+            result["regions"] = zone_boxes
+        if not len(result["words"]):
+            textless.add(result["page"])
+            regions = [page_box]
+        else:
+            regions = _textless_image_regions(
+                doc[result["page"] - 1], result["words"], dpis[result["page"]] / 72.0
+            )
+        if zone_boxes:
+            regions = _clip_boxes(regions, zone_boxes)
+        if regions:
+            regions_by_page[result["page"]] = regions
+        elif on_page:
+            on_page(result)
+
+    try:
+        pages = _run_native(pdf_path, dpis, on_page=plan)
+    finally:
+        doc.close()
+    if not regions_by_page:
+        return pages
+
+    by_number = {result["page"]: result for result in pages}
+
+    def merged(number: int, size: Tuple[int, int], words: WordTable) -> None:
+        result = by_number[number]
+        if number in textless:
+            result["source"] = "raster"
+            result["width"], result["height"] = size
+            result["words"] = words
+        else:
+            result["source"] = "native+raster"
+            result["words"] = WordTable.concat([result["words"], words])
+        if on_page:
+            on_page(result)
+
+    page_stream = pdf_service.iter_pages(
+        pdf_path,
+        dpi=profile["dpi"],
+        max_edge=profile["max_edge"],
+        pages=list(regions_by_page),
+    )
+    _ocr_crops(runner, page_stream, lambda number, image: regions_by_page[number], merged)
+    return pages
+
+
+def _raster_runner(
+    provider: str, workers: Optional[int] = None, batch_size: Optional[int] = None
+):
+    provider_key = provider.lower().strip()
+    if provider_key == "tesseract":
+        return functools.partial(_run_tesseract, workers=workers)
+    if provider_key == "easyocr":
+        return _run_easyocr
+    if provider_key == "paddleocr":
+        return _run_paddleocr
+    if provider_key == "surya":
+        return functools.partial(_run_surya, batch_size=batch_size)
+    raise RuntimeError(f"Unknown OCR provider '{provider}'.")
+
+
+@functools.lru_cache(maxsize=None)
+def _provider_version(provider_key: str) -> str:
+    from importlib import metadata
+
+    try:
+        version = metadata.version(_PROVIDER_PACKAGES[provider_key])
+    except metadata.PackageNotFoundError:
+        version = "unknown"
+    if provider_key == "tesseract":
+        try:
+            import pytesseract
+
+            version = f"{version}+tesseract-{pytesseract.get_tesseract_version()}"
+        except Exception:
+            pass
+    return version
+
+
+def _page_cache_key(provider_key: str, image, preprocess: Dict[str, Any]) -> str:
+    payload = json.dumps(
+        {
+            "raster": cache_service.image_digest(image),
+            "provider": provider_key,
+            "version": _provider_version(provider_key),
+            "config": _PROVIDER_CONFIG.get(provider_key, {}),
+            "preprocess": preprocess,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _cached_runner(
+    provider: str, runner, stats: Dict[str, int], steps: Optional[List[str]] = None
+):
+    """Wrap a raster runner so pages already OCRed by the same provider are read back from disk.
+
+    Only cache misses reach the provider; cached and computed results are merged back in
+    stream order. Hit and miss counts are added to ``stats``. ``steps`` are the
+    preprocessing steps ``runner`` applies, which are part of the key.
+    """
+    provider_key = provider.lower().strip()
+    cache = cache_service.get_ocr_cache()
+    preprocess = preprocess_service.settings(steps or [])
+
+    def run(
+        pages, on_page: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> List[Dict[str, Any]]:
+        cached: List[Dict[str, Any]] = []
+        keys: Dict[int, str] = {}
+
+        def misses():
+            for index, image in pages:
+                key = _page_cache_key(provider_key, image, preprocess)
+                data = cache.get_bytes(key)
+                if data is not None:
+                    try:
+                        with np.load(io.BytesIO(data)) as arrays:
+                            width, height = arrays["size"].tolist()
+                            words = WordTable.from_arrays(arrays)
+                    except (OSError, ValueError, KeyError):
+                        cache.delete(key)
+                    else:
+                        cached.append(
+                            {"page": index, "width": width, "height": height, "words": words}
+                        )
+                        if on_page:
+                            on_page(cached[-1])
+                        continue
+                keys[index] = key
+                yield index, image
+                image = None
+
+        def store(result: Dict[str, Any]) -> None:
+            key = keys.get(result["page"])
+            if key is not None:
+                buffer = io.BytesIO()
+                np.savez(
+                    buffer,
+                    size=np.array([result["width"], result["height"]]),
+                    **result["words"].columns(),
+                )
+                cache.put_bytes(key, buffer.getvalue())
+            if on_page:
+                on_page(result)
+
+        computed = runner(misses(), on_page=store)
+        stats["cached_pages"] = stats.get("cached_pages", 0) + len(cached)
+        stats["computed_pages"] = stats.get("computed_pages", 0) + len(computed)
+        return sorted(cached + computed, key=lambda result: result["page"])
+
+    return run
+
+
+def run_ocr(
+    pdf_path: str,
+    provider: str,
+    dpi: Optional[int] = None,
+    fallback_provider: str = "tesseract",
+    pages: Optional[List[int]] = None,
+    max_edge: Optional[int] = None,
+    workers: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    cache: bool = True,
+    regions: Optional[List[Union[str, List[float]]]] = None,
+    preprocess: Optional[List[str]] = None,
+    page_stream=None,
+    on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """OCR a PDF with one provider.
+
+    ``page_stream`` supplies the rendered pages for raster providers instead of
+    rendering them here; it must yield the pages ``dpi``/``max_edge`` resolve to.
+    ``on_page`` is called with each page as soon as it is finished: when it is OCRed
+    for plain raster runs, when it is read from the text layer for native runs (and
+    auto pages that need no raster pass), and when all of its crops are merged for
+    zone and auto runs.
+    """
     if not os.path.exists(pdf_path):
         raise FileNotFoundError("PDF not found.")
 
     start_time = time.perf_counter()
-    images = convert_from_path(pdf_path, dpi=dpi, poppler_path=POPPLER_PATH)
     provider_key = provider.lower().strip()
-    if provider_key == "tesseract":
-        pages = _run_tesseract(images)
-    elif provider_key == "easyocr":
-        pages = _run_easyocr(images)
-    elif provider_key == "paddleocr":
-        pages = _run_paddleocr(images)
-    elif provider_key == "surya":
-        pages = _run_surya(images)
+    profile = pdf_service.render_profile(
+        fallback_provider if provider_key == "auto" else provider_key, dpi, max_edge
+    )
+    dpis = pdf_service.page_dpis(pdf_path, profile["dpi"], profile["max_edge"], pages)
+    zones = parse_regions(regions)
+    steps = preprocess_service.parse_steps(preprocess)
+    cache_stats: Dict[str, int] = {}
+
+    def finish(result: Dict[str, Any]) -> None:
+        result["page_dpi"] = dpis[result["page"]]
+        if on_page:
+            on_page(result)
+
+    if provider_key != "native":
+        raster_provider = fallback_provider if provider_key == "auto" else provider_key
+        runner = _raster_runner(raster_provider, workers, batch_size)
+        # Tesseract reads 1-bit rasters directly; the other engines expect RGB.
+        output_mode = None if raster_provider.lower().strip() == "tesseract" else "RGB"
+        runner = preprocess_service.wrap_runner(runner, steps, cache_stats, output_mode)
+        if cache:
+            runner = _cached_runner(raster_provider, runner, cache_stats, steps)
+    if provider_key == "native":
+
+        def native_page(result: Dict[str, Any]) -> None:
+            if zones:
+                result["regions"] = _zone_boxes(zones, result["width"], result["height"])
+                result["words"] = _words_in_boxes(result["words"], result["regions"])
+            finish(result)
+
+        pages = _run_native(pdf_path, dpis, on_page=native_page)
+    elif provider_key == "auto":
+        pages = _run_auto(pdf_path, profile, dpis, runner, zones, on_page=finish)
     else:
-        raise RuntimeError(f"Unknown OCR provider '{provider}'.")
+        if page_stream is None:
+            page_stream = pdf_service.iter_pages(
+                pdf_path, dpi=profile["dpi"], max_edge=profile["max_edge"], pages=list(dpis)
+            )
+        if zones:
+            pages = _run_zones(page_stream, runner, zones, on_page=finish)
+        else:
+            pages = runner(page_stream, on_page=finish)
 
     elapsed_ms = int((time.perf_counter() - start_time) * 1000)
-    return {
+    metrics = {**_summarize(pages), "elapsed_ms": elapsed_ms}
+    if provider_key in ("native", "auto"):
+        sources = [page.get("source") for page in pages]
+        metrics["native_pages"] = sources.count("native")
+        metrics["raster_pages"] = len(sources) - metrics["native_pages"]
+    metrics.update(cache_stats)
+    output = {
         "provider": provider_key,
+        "render": {**profile, "page_dpi": dpis},
         "pages": pages,
-        "metrics": {**_summarize(pages), "elapsed_ms": elapsed_ms},
+        "metrics": metrics,
+    }
+    if zones:
+        output["regions"] = zones
+    if steps:
+        output["preprocess"] = steps
+    return output
+
+
+def _shared_profile(
+    providers: List[str], dpi: Optional[int], max_edge: Optional[int]
+) -> Dict[str, Optional[int]]:
+    """One render profile that gives every provider at least the pixels it asks for."""
+    profiles = [pdf_service.render_profile(provider, dpi, max_edge) for provider in providers]
+    edges = [profile["max_edge"] for profile in profiles]
+    return {
+        "dpi": max(profile["dpi"] for profile in profiles),
+        "max_edge": None if None in edges else max(edges),
+    }
+
+
+def compare_ocr(
+    pdf_path: str,
+    providers: List[str],
+    dpi: Optional[int] = None,
+    max_edge: Optional[int] = None,
+    pages: Optional[List[int]] = None,
+    **options: Any,
+) -> Dict[str, Any]:
+    """Run several OCR providers concurrently over a single render of the pages.
+
+    Raster providers share one page stream (see :func:`pdf_service.tee_pages`)
+    rendered at the highest resolution any of them asks for; "native" and "auto"
+    read the text layer themselves. Each provider runs on its own thread. Returns
+    ``{provider: output}``, with the exception as the value for providers that failed.
+    """
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError("PDF not found.")
+
+    providers = list(dict.fromkeys(provider.lower().strip() for provider in providers))
+    raster = [provider for provider in providers if provider not in ("native", "auto")]
+    shared = _shared_profile(raster, dpi, max_edge) if raster else None
+    streams: Dict[str, Any] = {}
+    if raster:
+        page_stream = pdf_service.iter_pages(
+            pdf_path, dpi=shared["dpi"], max_edge=shared["max_edge"], pages=pages
+        )
+        streams = dict(zip(raster, pdf_service.tee_pages(page_stream, len(raster))))
+
+    def run(provider: str) -> Dict[str, Any]:
+        stream = streams.get(provider)
+        try:
+            if stream is None:
+                return run_ocr(
+                    pdf_path, provider, dpi=dpi, max_edge=max_edge, pages=pages, **options
+                )
+            return run_ocr(
+                pdf_path,
+                provider,
+                dpi=shared["dpi"],
+                max_edge=shared["max_edge"],
+                pages=pages,
+                page_stream=stream,
+                **options,
+            )
+        finally:
+            if stream is not None:
+                stream.close()
+
+    results: Dict[str, Any] = {}
+    with ThreadPoolExecutor(max_workers=len(providers) or 1) as executor:
+        futures = {provider: executor.submit(run, provider) for provider in providers}
+        for provider, future in futures.items():
+            try:
+                results[provider] = future.result()
+            except Exception as exc:
+                results[provider] = exc
+    return results
+
+
+def _page_texts(page: Dict[str, Any]) -> List[str]:
+    words = page.get("words") or []
+    if isinstance(words, WordTable):
+        return words.texts()
+    return [word["text"] for word in words]
+
+
+def comparison_summary(outputs: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Side-by-side metrics plus pairwise word agreement for completed provider outputs.
+
+    Agreement is the multiset Jaccard index of lower-cased word texts over all pages.
+    """
+    bags: Dict[str, Counter] = {}
+    providers: Dict[str, Dict[str, Any]] = {}
+    for provider, output in outputs.items():
+        metrics = output.get("metrics") or {}
+        providers[provider] = {
+            key: metrics.get(key) for key in ("elapsed_ms", "word_count", "avg_confidence")
+        }
+        bags[provider] = Counter(
+            text.lower() for page in output.get("pages") or [] for text in _page_texts(page)
+        )
+
+    agreement = {}
+    names = sorted(bags)
+    for index, first in enumerate(names):
+        for second in names[index + 1 :]:
+            union = sum((bags[first] | bags[second]).values())
+            shared = sum((bags[first] & bags[second]).values())
+            agreement[f"{first}|{second}"] = round(shared / union, 4) if union else None
+
+    timed = [name for name in names if providers[name]["elapsed_ms"] is not None]
+    scored = [name for name in names if providers[name]["avg_confidence"] is not None]
+    return {
+        "providers": providers,
+        "agreement": agreement,
+        "fastest_provider": min(
+            timed, key=lambda name: providers[name]["elapsed_ms"], default=None
+        ),
+        "highest_confidence_provider": max(
+            scored, key=lambda name: providers[name]["avg_confidence"], default=None
+        ),
     }
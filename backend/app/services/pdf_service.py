@@ -1,17 +1,59 @@
+import hashlib
+import io
 import json
 import os
+import queue
+import threading
 import time
 import uuid
-from typing import Any, Dict, List
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import fitz
 from pdf2image import convert_from_path
+from PIL import Image
+
+from . import cache_service, tile_service
 
 # Poppler path for Windows
 POPPLER_PATH = os.environ.get(
     "POPPLER_PATH",
     r"C:\Users\michael.martello\Downloads\poppler-install\poppler-25.07.0\Library\bin"
 )
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+PAGE_FORMATS = {
+    "png": ("PNG", "image/png"),
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "jpg": ("JPEG", "image/jpeg"),
+}
+# "poppler" (pdf2image) or "pymupdf"
+RENDER_BACKEND = os.getenv("RENDER_BACKEND", "poppler")
+# Freshly rendered pages alive at once when streaming, across all render workers.
+# 0 sizes it per document: two pages per worker, within RENDER_MEMORY_MB.
+RENDER_WINDOW = int(os.getenv("RENDER_WINDOW", "0"))
+# Budget for freshly rendered rasters when the window is sized per document. A large
+# ARCH D sheet at 300 dpi is over 200 MB, so big sheets get fewer pages in flight.
+RENDER_MEMORY_MB = int(os.getenv("RENDER_MEMORY_MB", "2048"))
+# Parallel render workers; defaults to the number of cores.
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "0")) or os.cpu_count() or 1
+DEFAULT_DPI = 200
+# Per-provider render targets: "dpi" is the target resolution, "max_edge" caps the long
+# edge in pixels. Models that downsample internally only get the pixels they can use.
+RENDER_PROFILES: Dict[str, Dict[str, int]] = {
+    "default": {"dpi": DEFAULT_DPI},
+    "tesseract": {"dpi": 300},
+    "easyocr": {"dpi": DEFAULT_DPI},
+    "paddleocr": {"dpi": DEFAULT_DPI},
+    "surya": {"dpi": DEFAULT_DPI},
+    "native": {"dpi": DEFAULT_DPI},
+    "layoutlmv3": {"dpi": DEFAULT_DPI},
+    "yolov8": {"dpi": DEFAULT_DPI, "max_edge": 1280},
+    "grounding_dino": {"dpi": DEFAULT_DPI, "max_edge": 1333},
+    "openai": {"dpi": DEFAULT_DPI, "max_edge": 2048},
+    "ollama": {"dpi": DEFAULT_DPI, "max_edge": 1536},
+}
+RENDER_PROFILES.update(json.loads(os.getenv("RENDER_PROFILES", "{}")))
 
 
 def ensure_dirs(base_dir: str) -> Dict[str, str]:
@@ -23,13 +65,17 @@ def ensure_dirs(base_dir: str) -> Dict[str, str]:
     return {"uploads": uploads_dir, "pages": pages_dir, "results": results_dir}
 
 
-def save_upload(file_name: str, content: bytes, uploads_dir: str) -> str:
+def save_upload(file_name: str, source: BinaryIO, uploads_dir: str) -> Tuple[str, str]:
+    """Stream an upload to disk, returning its stored path and SHA-256."""
     ext = os.path.splitext(file_name)[1] or ".pdf"
     stored_name = f"{uuid.uuid4().hex}{ext}"
     stored_path = os.path.join(uploads_dir, stored_name)
+    digest = hashlib.sha256()
     with open(stored_path, "wb") as handle:
-        handle.write(content)
-    return stored_path
+        for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            handle.write(chunk)
+    return stored_path, digest.hexdigest()
 
 
 def extract_metadata(pdf_path: str) -> Dict[str, Any]:
@@ -40,25 +86,498 @@ def extract_metadata(pdf_path: str) -> Dict[str, Any]:
     return metadata
 
 
-def render_pages(pdf_path: str, pages_dir: str, dpi: int = 200) -> List[Dict[str, Any]]:
-    images = convert_from_path(pdf_path, dpi=dpi, poppler_path=POPPLER_PATH)
+def page_count(pdf_path: str) -> int:
+    doc = fitz.open(pdf_path)
+    count = doc.page_count
+    doc.close()
+    return count
+
+
+def parse_page_selection(
+    selection: Union[str, Iterable[int], None], count: int
+) -> Optional[List[int]]:
+    """Parse ``"1-5,12"`` or ``[1, 2, 3]`` into sorted 1-based page numbers.
+
+    ``None`` or an empty selection means every page.
+    """
+    if selection is None:
+        return None
+    numbers = set()
+    if isinstance(selection, str):
+        for part in selection.replace(" ", "").split(","):
+            if not part:
+                continue
+            start, sep, end = part.partition("-")
+            try:
+                first = int(start)
+                last = int(end) if sep else first
+            except ValueError as exc:
+                raise ValueError(f"Invalid page range '{part}'.") from exc
+            if first > last:
+                raise ValueError(f"Invalid page range '{part}'.")
+            numbers.update(range(first, last + 1))
+    else:
+        numbers.update(int(number) for number in selection)
+    if not numbers:
+        return None
+    out_of_range = [number for number in numbers if number < 1 or number > count]
+    if out_of_range:
+        raise ValueError(f"Page {min(out_of_range)} is out of range (1-{count}).")
+    return sorted(numbers)
+
+
+def _rasterize_pymupdf(pdf_path: str, first_page: int, last_page: int, dpi: int, colorspace: str):
+    doc = fitz.open(pdf_path)
+    try:
+        images = []
+        for index in range(first_page - 1, last_page):
+            pixmap = doc[index].get_pixmap(
+                dpi=dpi,
+                colorspace=fitz.csGRAY if colorspace == "L" else fitz.csRGB,
+                alpha=False,
+            )
+            images.append(
+                Image.frombytes(colorspace, (pixmap.width, pixmap.height), pixmap.samples)
+            )
+            pixmap = None
+        return images
+    finally:
+        doc.close()
+
+
+def _rasterize(
+    pdf_path: str,
+    first_page: int,
+    last_page: int,
+    dpi: int,
+    colorspace: str,
+    backend: Optional[str] = None,
+):
+    backend_key = (backend or RENDER_BACKEND).lower().strip()
+    if backend_key == "pymupdf":
+        return _rasterize_pymupdf(pdf_path, first_page, last_page, dpi, colorspace)
+    if backend_key == "poppler":
+        return convert_from_path(
+            pdf_path,
+            dpi=dpi,
+            first_page=first_page,
+            last_page=last_page,
+            grayscale=colorspace == "L",
+            poppler_path=POPPLER_PATH,
+        )
+    raise RuntimeError(f"Unknown render backend '{backend}'. Use 'poppler' or 'pymupdf'.")
+
+
+def _render_executor(backend: Optional[str], workers: int) -> Executor:
+    # PyMuPDF renders in-process and holds the GIL, so it needs separate processes;
+    # poppler already runs as a subprocess per call, so threads are enough.
+    if (backend or RENDER_BACKEND).lower().strip() == "pymupdf":
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers)
+
+
+def render_profile(
+    provider: str, dpi: Optional[int] = None, max_edge: Optional[int] = None
+) -> Dict[str, Optional[int]]:
+    """Resolve the render settings for a provider, with per-request overrides.
+
+    ``dpi`` is the target resolution and ``max_edge`` caps the long edge in pixels;
+    an explicit ``dpi`` without ``max_edge`` drops the profile's pixel cap.
+    """
+    profile = RENDER_PROFILES.get(provider.lower().strip(), RENDER_PROFILES["default"])
+    resolved = {"dpi": profile.get("dpi", DEFAULT_DPI), "max_edge": profile.get("max_edge")}
+    if dpi:
+        resolved = {"dpi": dpi, "max_edge": None}
+    if max_edge:
+        resolved["max_edge"] = max_edge
+    return resolved
+
+
+def page_dpis(
+    pdf_path: str,
+    dpi: int,
+    max_edge: Optional[int] = None,
+    pages: Optional[Iterable[int]] = None,
+) -> Dict[int, int]:
+    """Effective dpi per page: ``dpi``, lowered where the long edge would exceed ``max_edge``."""
+    doc = fitz.open(pdf_path)
+    try:
+        numbers = range(1, doc.page_count + 1) if pages is None else pages
+        dpis = {}
+        for number in numbers:
+            if not 1 <= number <= doc.page_count:
+                continue
+            page_dpi = dpi
+            if max_edge:
+                rect = doc[number - 1].rect
+                page_dpi = min(dpi, int(max_edge * 72 / max(rect.width, rect.height, 1)))
+            dpis[number] = max(1, page_dpi)
+        return dpis
+    finally:
+        doc.close()
+
+
+def _render_window(
+    pdf_path: str, dpis: Dict[int, int], workers: int, colorspace: str = "RGB"
+) -> int:
+    """Two pages per worker, fewer if the largest page would overrun ``RENDER_MEMORY_MB``."""
+    if not dpis:
+        return 1
+    channels = 1 if colorspace == "L" else 3
+    doc = fitz.open(pdf_path)
+    try:
+        page_bytes = max(
+            doc[number - 1].rect.width * doc[number - 1].rect.height * (dpi / 72) ** 2 * channels
+            for number, dpi in dpis.items()
+        )
+    finally:
+        doc.close()
+    return max(1, min(2 * workers, int(RENDER_MEMORY_MB * 1024 * 1024 // max(page_bytes, 1))))
+
+
+def _page_windows(page_dpis: Dict[int, int], window: int) -> List[Tuple[int, int]]:
+    """Group sorted page numbers into contiguous same-dpi runs of at most ``window`` pages."""
+    windows: List[Tuple[int, int]] = []
+    for number in sorted(page_dpis):
+        if (
+            windows
+            and number == windows[-1][1] + 1
+            and number - windows[-1][0] < window
+            and page_dpis[number] == page_dpis[windows[-1][0]]
+        ):
+            windows[-1] = (windows[-1][0], number)
+        else:
+            windows.append((number, number))
+    return windows
+
+
+def iter_pages(
+    pdf_path: str,
+    dpi: int = DEFAULT_DPI,
+    colorspace: str = "RGB",
+    window: Optional[int] = None,
+    backend: Optional[str] = None,
+    workers: Optional[int] = None,
+    pages: Optional[Iterable[int]] = None,
+    max_edge: Optional[int] = None,
+) -> Iterator[Tuple[int, Any]]:
+    """Yield ``(page_number, image)`` one page at a time, going through the raster cache.
+
+    At most ``window`` freshly rendered pages are alive at once regardless of page
+    count or ``workers``: cache misses are split into ``window // workers``-page
+    render calls, and up to ``workers`` of them are rendered ahead in parallel.
+    ``workers`` defaults to ``RENDER_WORKERS``, and ``window`` to ``RENDER_WINDOW`` or,
+    when that is 0, two pages per worker within ``RENDER_MEMORY_MB``.
+    ``pages`` restricts rendering to the given 1-based page numbers, and
+    ``max_edge`` lowers the dpi of pages whose long edge would exceed it.
+    Callers should drop each image before advancing the iterator.
+    """
+    workers = max(1, workers or RENDER_WORKERS)
+    cache = cache_service.get_raster_cache()
+    pdf_hash = cache_service.file_sha256(pdf_path)
+    dpis = page_dpis(pdf_path, dpi, max_edge, pages)
+    page_numbers = sorted(dpis)
+    keys = {
+        number: cache.key(pdf_hash, number, dpis[number], colorspace) for number in page_numbers
+    }
+
+    missing = {number: dpis[number] for number in page_numbers if not cache.contains(keys[number])}
+    window = window or RENDER_WINDOW or _render_window(pdf_path, missing, workers, colorspace)
+    window = max(1, window)
+    workers = min(workers, window)
+    windows = _page_windows(missing, window // workers)
+    window_of = {
+        number: (first, last) for first, last in windows for number in range(first, last + 1)
+    }
+    executor = _render_executor(backend, workers) if workers > 1 and len(windows) > 1 else None
+    pending: Dict[int, Future] = {}
+    next_window = 0
+
+    def submit_ahead() -> None:
+        # The chunk being consumed counts against the workers' share of the window.
+        nonlocal next_window
+        busy = 1 if rendered else 0
+        while executor and next_window < len(windows) and len(pending) + busy < workers:
+            first, last = windows[next_window]
+            pending[first] = executor.submit(
+                _rasterize, pdf_path, first, last, dpis[first], colorspace, backend
+            )
+            next_window += 1
+
+    rendered: List[Any] = []
+    try:
+        for number in page_numbers:
+            if number not in window_of:
+                image = cache.get(keys[number])
+                if image is None:
+                    # Evicted between the existence check and the read.
+                    image = _rasterize(
+                        pdf_path, number, number, dpis[number], colorspace, backend
+                    )[0]
+                    cache.put(keys[number], image)
+                yield number, image
+                image = None
+                continue
+            first, last = window_of[number]
+            if number == first:
+                submit_ahead()
+                if first in pending:
+                    rendered = pending.pop(first).result()
+                else:
+                    rendered = _rasterize(pdf_path, first, last, dpis[first], colorspace, backend)
+                if len(rendered) != last - first + 1:
+                    raise RuntimeError("Failed to render PDF pages.")
+                rendered.reverse()
+                submit_ahead()
+            image = rendered.pop()
+            cache.put(keys[number], image)
+            yield number, image
+            image = None
+    finally:
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _TeeBranch:
+    """One consumer's view of a :func:`tee_pages` stream."""
+
+    def __init__(self, tee: "_PageTee", index: int):
+        self._tee = tee
+        self._index = index
+        self.closed = threading.Event()
+        self.queue: "queue.Queue[Tuple[Any, Any]]" = queue.Queue(maxsize=tee.buffer)
+
+    def __iter__(self) -> "_TeeBranch":
+        return self
+
+    def __next__(self) -> Tuple[int, Any]:
+        if self.closed.is_set():
+            raise StopIteration
+        self._tee.start()
+        item = self.queue.get()
+        if item[0] is _TEE_END:
+            self.close()
+            if item[1] is not None:
+                raise item[1]
+            raise StopIteration
+        return item
+
+    def close(self) -> None:
+        self.closed.set()
+
+
+_TEE_END = object()
+
+
+class _PageTee:
+    def __init__(self, pages: Iterator[Tuple[int, Any]], count: int, buffer: int):
+        self.pages = pages
+        self.buffer = buffer
+        self.branches = [_TeeBranch(self, index) for index in range(count)]
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._produce, daemon=True)
+                self._thread.start()
+
+    def _put(self, branch: _TeeBranch, item) -> None:
+        while not branch.closed.is_set():
+            try:
+                branch.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _produce(self) -> None:
+        end = (_TEE_END, None)
+        try:
+            for item in self.pages:
+                if all(branch.closed.is_set() for branch in self.branches):
+                    break
+                for branch in self.branches:
+                    self._put(branch, item)
+                item = None
+        except Exception as exc:
+            end = (_TEE_END, exc)
+        finally:
+            close = getattr(self.pages, "close", None)
+            if close:
+                close()
+        for branch in self.branches:
+            self._put(branch, end)
+
+
+def tee_pages(
+    pages: Iterator[Tuple[int, Any]], count: int, buffer: Optional[int] = None
+) -> List[_TeeBranch]:
+    """Fan one ``(page_number, image)`` stream out to ``count`` concurrent consumers.
+
+    A producer thread pulls from ``pages`` and hands every page to each branch through
+    a queue of ``buffer`` pages, so rendering runs once and stays at most ``buffer``
+    pages ahead of the slowest consumer. Images are shared and must be treated as
+    read-only. A consumer that stops early must call ``close()`` on its branch.
+    """
+    return _PageTee(pages, count, max(1, buffer or RENDER_WINDOW or 2)).branches
+
+
+def _page_tiles(image, number: int, pages_dir: str, base_name: str, workers: Optional[int]):
+    tiles_dir = os.path.join(pages_dir, "tiles")
+    os.makedirs(tiles_dir, exist_ok=True)
+    return tile_service.build_pyramid(
+        image, tiles_dir, f"{base_name}_page_{number}", workers=workers
+    )
+
+
+def _render_chunk_pymupdf(
+    pdf_path: str,
+    pages_dir: str,
+    first_page: int,
+    last_page: int,
+    dpi: int,
+    tiles: bool = False,
+    tile_workers: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Render and save a page range in a worker process, seeding the disk raster cache."""
+    cache = cache_service.get_raster_cache()
+    pdf_hash = cache_service.file_sha256(pdf_path)
+    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    output_pages = []
+    for number in range(first_page, last_page + 1):
+        image = _rasterize_pymupdf(pdf_path, number, number, dpi, "RGB")[0]
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG")
+        data = buffer.getvalue()
+        file_path = os.path.join(pages_dir, f"{base_name}_page_{number}.png")
+        with open(file_path, "wb") as handle:
+            handle.write(data)
+        if cache.disk.max_bytes > 0:
+            cache.disk.put_bytes(cache.key(pdf_hash, number, dpi, "RGB"), data)
+        page = {"page": number, "path": file_path, "width": image.width, "height": image.height}
+        if tiles:
+            page["tiles"] = _page_tiles(image, number, pages_dir, base_name, tile_workers)
+        output_pages.append(page)
+    return output_pages
+
+
+def render_pages(
+    pdf_path: str,
+    pages_dir: str,
+    dpi: int = 200,
+    backend: Optional[str] = None,
+    workers: Optional[int] = None,
+    tiles: bool = False,
+) -> List[Dict[str, Any]]:
+    """Save every page as a PNG, plus a DZI tile pyramid and preview when ``tiles`` is set."""
+    backend_key = (backend or RENDER_BACKEND).lower().strip()
+    workers = max(1, workers or RENDER_WORKERS)
+    count = page_count(pdf_path)
+    if backend_key == "pymupdf" and workers > 1 and count > 1:
+        chunk = -(-count // workers)
+        tile_workers = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    _render_chunk_pymupdf,
+                    pdf_path,
+                    pages_dir,
+                    first,
+                    min(count, first + chunk - 1),
+                    dpi,
+                    tiles,
+                    tile_workers,
+                )
+                for first in range(1, count + 1, chunk)
+            ]
+            return [page for future in futures for page in future.result()]
+
     output_pages: List[Dict[str, Any]] = []
     base_name = os.path.splitext(os.path.basename(pdf_path))[0]
-    for idx, image in enumerate(images, start=1):
+    for idx, image in iter_pages(pdf_path, dpi=dpi, backend=backend, workers=workers):
         file_name = f"{base_name}_page_{idx}.png"
         file_path = os.path.join(pages_dir, file_name)
         image.save(file_path, "PNG")
-        output_pages.append(
-            {
-                "page": idx,
-                "path": file_path,
-                "width": image.width,
-                "height": image.height,
-            }
-        )
+        page = {
+            "page": idx,
+            "path": file_path,
+            "width": image.width,
+            "height": image.height,
+        }
+        if tiles:
+            page["tiles"] = _page_tiles(image, idx, pages_dir, base_name, None)
+        output_pages.append(page)
     return output_pages
 
 
+def _page_file_format(fmt: str) -> Tuple[str, str]:
+    fmt_key = fmt.lower().strip()
+    if fmt_key not in PAGE_FORMATS:
+        raise ValueError(f"Unknown image format '{fmt}'. Use one of: {', '.join(PAGE_FORMATS)}.")
+    return PAGE_FORMATS[fmt_key]
+
+
+def _page_file_key(pdf_hash: str, page: int, dpi: int, pil_format: str, quality: int) -> str:
+    return hashlib.sha256(f"{pdf_hash}:{page}:{dpi}:{pil_format}:{quality}".encode()).hexdigest()
+
+
+def _put_page_file(key: str, image, pil_format: str, quality: int) -> str:
+    buffer = io.BytesIO()
+    if pil_format == "PNG":
+        image.save(buffer, pil_format)
+    else:
+        image.save(buffer, pil_format, quality=quality)
+    return cache_service.get_page_file_cache().put_bytes(key, buffer.getvalue())
+
+
+def render_page_file(
+    pdf_path: str, page: int, dpi: int = 200, fmt: str = "png", quality: int = 85
+) -> Tuple[str, str]:
+    """Render one page on demand and return ``(path, media_type)`` of the encoded image.
+
+    Encoded files are cached on disk by (PDF hash, page, dpi, format, quality), so
+    only the first request for a page pays for rendering and encoding.
+    """
+    pil_format, media_type = _page_file_format(fmt)
+    key = _page_file_key(cache_service.file_sha256(pdf_path), page, dpi, pil_format, quality)
+    path = cache_service.get_page_file_cache().get_path(key)
+    if path is None:
+        rendered = list(iter_pages(pdf_path, dpi=dpi, pages=[page]))
+        if not rendered:
+            raise ValueError(f"Page {page} is out of range.")
+        path = _put_page_file(key, rendered[0][1], pil_format, quality)
+    return path, media_type
+
+
+def render_page_files(
+    pdf_path: str,
+    pages: Iterable[int],
+    dpi: int = 200,
+    fmt: str = "png",
+    quality: int = 85,
+) -> Dict[int, str]:
+    """Like :func:`render_page_file` for many pages, returning ``{page: path}``.
+
+    Cache misses are rendered together through :func:`iter_pages`, so they are
+    batched into windows and spread over the render workers.
+    """
+    pil_format, _ = _page_file_format(fmt)
+    cache = cache_service.get_page_file_cache()
+    pdf_hash = cache_service.file_sha256(pdf_path)
+    keys = {page: _page_file_key(pdf_hash, page, dpi, pil_format, quality) for page in pages}
+    paths = {page: cache.get_path(key) for page, key in keys.items()}
+    missing = [page for page, path in paths.items() if path is None]
+    if missing:
+        for number, image in iter_pages(pdf_path, dpi=dpi, pages=missing):
+            paths[number] = _put_page_file(keys[number], image, pil_format, quality)
+            image = None
+    absent = sorted(page for page, path in paths.items() if path is None)
+    if absent:
+        raise ValueError(f"Page {absent[0]} is out of range.")
+    return paths
+
+
 def write_json(output: Dict[str, Any], results_dir: str, stem: str) -> str:
     file_path = os.path.join(results_dir, f"{stem}.json")
     with open(file_path, "w", encoding="utf-8") as handle:
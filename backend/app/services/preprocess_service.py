@@ -0,0 +1,305 @@
+import math
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .columnar_service import WordTable
+
+# Steps run in this order whatever order a request lists them in.
+STEPS = ("grayscale", "deskew", "binarize", "despeckle", "trim")
+
+# Bradley adaptive threshold: a pixel is ink when it is BINARIZE_K darker than the mean
+# of its window. A window of 0 sizes it to 1/64 of the shorter raster edge.
+BINARIZE_WINDOW = int(os.getenv("BINARIZE_WINDOW", "0"))
+BINARIZE_K = float(os.getenv("BINARIZE_K", "0.15"))
+DESKEW_MAX_ANGLE = float(os.getenv("DESKEW_MAX_ANGLE", "5"))
+DESKEW_STEP = float(os.getenv("DESKEW_STEP", "0.1"))
+# Ink pixels with fewer ink neighbours than this (of 8) are removed as speckle.
+DESPECKLE_MIN_NEIGHBORS = int(os.getenv("DESPECKLE_MIN_NEIGHBORS", "2"))
+TRIM_MARGIN = int(os.getenv("TRIM_MARGIN", "16"))
+
+_BINARIZE_STRIP = 256
+_DESKEW_SAMPLE_EDGE = 1024
+_DESKEW_MAX_POINTS = 200_000
+
+
+def parse_steps(steps: Optional[Iterable[str]]) -> List[str]:
+    """Normalize requested steps into pipeline order. Raises ValueError for unknown steps."""
+    requested = {step.lower().strip() for step in steps or []}
+    unknown = requested.difference(STEPS)
+    if unknown:
+        raise ValueError(
+            f"Unknown preprocess step(s): {', '.join(sorted(unknown))}. "
+            f"Use any of: {', '.join(STEPS)}."
+        )
+    return [step for step in STEPS if step in requested]
+
+
+def settings(steps: List[str]) -> Dict[str, Any]:
+    """Everything that determines the pixels :func:`preprocess` produces, for cache keys."""
+    if not steps:
+        return {}
+    return {
+        "steps": steps,
+        "binarize_window": BINARIZE_WINDOW,
+        "binarize_k": BINARIZE_K,
+        "deskew_max_angle": DESKEW_MAX_ANGLE,
+        "deskew_step": DESKEW_STEP,
+        "despeckle_min_neighbors": DESPECKLE_MIN_NEIGHBORS,
+        "trim_margin": TRIM_MARGIN,
+    }
+
+
+class Transform:
+    """Affine map from preprocessed raster pixels back to the original raster."""
+
+    __slots__ = ("matrix", "size")
+
+    def __init__(self, size: Tuple[int, int]):
+        self.matrix = np.eye(3)
+        self.size = size
+
+    def then(self, matrix: np.ndarray) -> None:
+        """Append a step whose output->input map is ``matrix``."""
+        self.matrix = self.matrix @ matrix
+
+    @property
+    def identity(self) -> bool:
+        return bool(np.allclose(self.matrix, np.eye(3)))
+
+    def map_table(self, table: WordTable) -> WordTable:
+        """Map boxes to the original raster, as the bounds of their transformed corners."""
+        if self.identity or not len(table):
+            return table
+        x0, y0, x1, y1 = (table.bbox[:, index].astype(np.float64) for index in range(4))
+        corners = np.stack(
+            [
+                np.stack([x0, x1, x1, x0]),
+                np.stack([y0, y0, y1, y1]),
+                np.ones((4, len(table))),
+            ]
+        )
+        mapped = np.einsum("ij,jkn->ikn", self.matrix, corners)
+        width, height = self.size
+        bbox = np.stack(
+            [
+                np.clip(mapped[0].min(axis=0), 0, width),
+                np.clip(mapped[1].min(axis=0), 0, height),
+                np.clip(mapped[0].max(axis=0), 0, width),
+                np.clip(mapped[1].max(axis=0), 0, height),
+            ],
+            axis=1,
+        )
+        return WordTable(
+            table.text,
+            table.text_offsets,
+            np.rint(bbox).astype(np.int32),
+            table.confidence,
+            table.label,
+            table.label_offsets,
+        )
+
+
+def _grayscale(pixels: np.ndarray) -> np.ndarray:
+    if pixels.ndim == 2:
+        return pixels.astype(np.float32)
+    weights = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    return pixels[..., :3].astype(np.float32) @ weights
+
+
+def _binarize(gray: np.ndarray) -> np.ndarray:
+    """Ink mask from a Bradley adaptive threshold computed with integral images.
+
+    Rows are processed in strips so the float64 running sums only ever cover a strip
+    plus the window's margin, not the whole page.
+    """
+    height, width = gray.shape
+    window = BINARIZE_WINDOW or max(15, min(height, width) // 64)
+    half = window // 2
+    left = np.clip(np.arange(width) - half, 0, width)
+    right = np.clip(np.arange(width) + half + 1, 0, width)
+    widths = (right - left).astype(np.float64)
+    ink = np.empty((height, width), dtype=bool)
+    strip = max(_BINARIZE_STRIP, window)
+    for start in range(0, height, strip):
+        stop = min(height, start + strip)
+        rows = np.arange(start, stop)
+        top = np.clip(rows - half, 0, height)
+        bottom = np.clip(rows + half + 1, 0, height)
+        first = int(top[0])
+        # Separable box sums: column sums over the window rows, then row sums over those.
+        sums = np.zeros((int(bottom[-1]) - first + 1, width), dtype=np.float64)
+        np.cumsum(gray[first : int(bottom[-1])], axis=0, dtype=np.float64, out=sums[1:])
+        columns = sums[bottom - first]
+        columns -= sums[top - first]
+        sums = np.zeros((stop - start, width + 1), dtype=np.float64)
+        np.cumsum(columns, axis=1, out=sums[:, 1:])
+        boxes = sums[:, right]
+        boxes -= sums[:, left]
+        boxes *= 1.0 - BINARIZE_K
+        area = np.multiply.outer((bottom - top).astype(np.float64), widths)
+        area *= gray[start:stop]
+        ink[start:stop] = area < boxes
+    return ink
+
+
+def _ink(gray: np.ndarray) -> np.ndarray:
+    return gray < 128
+
+
+def _skew_angle(ink: np.ndarray) -> float:
+    """Angle in degrees that levels the strongest horizontal structure (projection profile)."""
+    step = max(1, int(math.ceil(max(ink.shape) / _DESKEW_SAMPLE_EDGE)))
+    sample = ink[::step, ::step]
+    ys, xs = np.nonzero(sample)
+    if ys.size < 100:
+        return 0.0
+    if ys.size > _DESKEW_MAX_POINTS:
+        keep = np.random.default_rng(0).choice(ys.size, _DESKEW_MAX_POINTS, replace=False)
+        ys, xs = ys[keep], xs[keep]
+    ys = ys.astype(np.float64)
+    xs = xs.astype(np.float64)
+    angles = np.arange(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + DESKEW_STEP / 2, DESKEW_STEP)
+    radians = np.radians(angles)
+    # Row each ink pixel lands on after rotating the page by each candidate angle.
+    projected = ys[None, :] * np.cos(radians)[:, None] + xs[None, :] * np.sin(radians)[:, None]
+    projected = np.rint(projected - projected.min(axis=1, keepdims=True)).astype(np.int64)
+    bins = int(projected.max()) + 1
+    offsets = (np.arange(len(angles)) * bins)[:, None]
+    histograms = np.bincount((projected + offsets).ravel(), minlength=len(angles) * bins)
+    scores = (histograms.reshape(len(angles), bins).astype(np.float64) ** 2).sum(axis=1)
+    # The best angle is the page's skew; rotating by its negative levels the page.
+    best = float(angles[int(np.argmax(scores))])
+    return 0.0 if abs(best) < DESKEW_STEP / 2 else -best
+
+
+def _rotation(angle: float, width: int, height: int) -> np.ndarray:
+    """Output->input map of ``Image.rotate(angle)`` about the raster centre."""
+    radians = -math.radians(angle)
+    cos, sin = math.cos(radians), math.sin(radians)
+    cx, cy = width / 2.0, height / 2.0
+    return np.array(
+        [
+            [cos, sin, cx - cos * cx - sin * cy],
+            [-sin, cos, cy + sin * cx - cos * cy],
+            [0.0, 0.0, 1.0],
+        ]
+    )
+
+
+def _despeckle(ink: np.ndarray) -> np.ndarray:
+    padded = np.pad(ink, 1).astype(np.uint8)
+    height, width = ink.shape
+    neighbors = sum(
+        padded[1 + dy : 1 + dy + height, 1 + dx : 1 + dx + width]
+        for dy in (-1, 0, 1)
+        for dx in (-1, 0, 1)
+        if dy or dx
+    )
+    return ink & (neighbors >= DESPECKLE_MIN_NEIGHBORS)
+
+
+def _content_box(ink: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    rows = np.flatnonzero(ink.any(axis=1))
+    cols = np.flatnonzero(ink.any(axis=0))
+    if not rows.size:
+        return None
+    height, width = ink.shape
+    return (
+        max(0, int(cols[0]) - TRIM_MARGIN),
+        max(0, int(rows[0]) - TRIM_MARGIN),
+        min(width, int(cols[-1]) + 1 + TRIM_MARGIN),
+        min(height, int(rows[-1]) + 1 + TRIM_MARGIN),
+    )
+
+
+def preprocess(image, steps: List[str], output_mode: Optional[str] = None):
+    """Run ``steps`` over one raster and return ``(image, transform)``.
+
+    Binarized output is a 1-bit image (black ink on white) unless ``output_mode``
+    asks for another mode. ``transform`` maps boxes on the result back to ``image``.
+    """
+    transform = Transform(image.size)
+    if not steps:
+        return (image.convert(output_mode) if output_mode else image), transform
+
+    gray = _grayscale(np.asarray(image))
+    if "deskew" in steps:
+        angle = _skew_angle(_ink(gray))
+        if angle:
+            rotated = Image.fromarray(gray.astype(np.uint8)).rotate(
+                angle, resample=Image.BILINEAR, fillcolor=255
+            )
+            gray = np.asarray(rotated).astype(np.float32)
+            transform.then(_rotation(angle, *image.size))
+
+    ink = None
+    if "binarize" in steps or "despeckle" in steps:
+        ink = _binarize(gray) if "binarize" in steps else _ink(gray)
+        if "despeckle" in steps:
+            ink = _despeckle(ink)
+    if "trim" in steps:
+        box = _content_box(ink if ink is not None else _ink(gray))
+        if box is not None:
+            x0, y0, x1, y1 = box
+            gray = gray[y0:y1, x0:x1]
+            ink = ink[y0:y1, x0:x1] if ink is not None else None
+            transform.then(np.array([[1.0, 0.0, x0], [0.0, 1.0, y0], [0.0, 0.0, 1.0]]))
+
+    if ink is not None:
+        result = Image.fromarray(~ink)
+    else:
+        result = Image.fromarray(np.clip(gray, 0, 255).astype(np.uint8))
+    if output_mode and result.mode != output_mode:
+        result = result.convert(output_mode)
+    return result, transform
+
+
+def preprocess_pages(
+    pages,
+    steps: List[str],
+    transforms: Dict[int, Transform],
+    stats: Dict[str, Any],
+    output_mode: Optional[str] = None,
+):
+    """Stream ``(page, image)`` pairs through :func:`preprocess`.
+
+    Each page's transform is stored in ``transforms`` and the time spent is added to
+    ``stats["preprocess_ms"]``.
+    """
+    for number, image in pages:
+        start = time.perf_counter()
+        processed, transform = preprocess(image, steps, output_mode)
+        stats["preprocess_ms"] = stats.get("preprocess_ms", 0) + int(
+            (time.perf_counter() - start) * 1000
+        )
+        transforms[number] = transform
+        image = None
+        yield number, processed
+
+
+def wrap_runner(runner, steps: List[str], stats: Dict[str, Any], output_mode: Optional[str] = None):
+    """Preprocess the pages a raster OCR runner sees and map its words back to the input rasters."""
+    if not steps:
+        return runner
+
+    def run(
+        pages, on_page: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> List[Dict[str, Any]]:
+        transforms: Dict[int, Transform] = {}
+
+        def restore(result: Dict[str, Any]) -> None:
+            transform = transforms.pop(result["page"])
+            result["words"] = transform.map_table(result["words"])
+            result["width"], result["height"] = transform.size
+            if on_page:
+                on_page(result)
+
+        return runner(
+            preprocess_pages(pages, steps, transforms, stats, output_mode), on_page=restore
+        )
+
+    return run
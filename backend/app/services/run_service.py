@@ -0,0 +1,129 @@
+import datetime as dt
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from ..models import Document, ProcessRun
+from ..schemas import ProcessRunOut
+from . import cache_service, columnar_service, pdf_service
+
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
+
+
+def document_hash(db: Session, document: Document) -> str:
+    """Return the document's content hash, backfilling it for older uploads."""
+    if not document.content_hash:
+        document.content_hash = cache_service.file_sha256(document.stored_path)
+        db.commit()
+    return document.content_hash
+
+
+def params_key(content_hash: str, stage: str, params: Dict[str, Any]) -> str:
+    """Hash of everything that determines a run's output."""
+    payload = json.dumps(
+        {"content_hash": content_hash, "stage": stage, "params": params},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def start_run(
+    db: Session, document: Document, stage: str, key: Optional[str] = None
+) -> ProcessRun:
+    run = ProcessRun(
+        document_id=document.id,
+        stage=stage,
+        status="running",
+        started_at=dt.datetime.utcnow(),
+        params_hash=key,
+    )
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+    return run
+
+
+def _file_url(path: str) -> str:
+    relative_path = os.path.relpath(path, DATA_DIR)
+    return f"/files/{relative_path.replace(os.sep, '/')}"
+
+
+def write_artifact(data: Dict[str, Any], stem: str) -> Dict[str, str]:
+    """Write a JSON artifact to the results directory and return its path and URL."""
+    dirs = pdf_service.ensure_dirs(DATA_DIR)
+    path = pdf_service.write_json(data, dirs["results"], stem)
+    return {"path": path, "url": _file_url(path)}
+
+
+def finish_run(db: Session, run: ProcessRun, output: Dict[str, Any]) -> Dict[str, Any]:
+    """Persist the run's JSON artifact and output, and mark it finished.
+
+    Word, token and detection tables go to a sibling ``.npz`` file; the JSON artifact
+    and ``output_json`` only keep per-page counts. :func:`run_out` expands them again.
+    """
+    run.finished_at = dt.datetime.utcnow()
+    dirs = pdf_service.ensure_dirs(DATA_DIR)
+    stem = f"run_{run.id}_{run.stage.replace(':', '_')}"
+    output = columnar_service.pack(output, os.path.join(dirs["results"], f"{stem}.npz"))
+    if "columnar" in output:
+        output["columnar"]["url"] = _file_url(output["columnar"]["path"])
+    output["artifact"] = write_artifact(output, stem)
+    run.output_json = json.dumps(output)
+    db.commit()
+    return output
+
+
+def find_reusable_run(
+    db: Session, document: Document, stage: str, key: str
+) -> Optional[ProcessRun]:
+    """Return a completed run with the same content hash, stage and parameters.
+
+    A match on another document (an older upload of the same file) is copied
+    onto this document so it shows up in its results and metrics.
+    """
+    match = (
+        db.query(ProcessRun)
+        .filter(ProcessRun.params_hash == key)
+        .filter(ProcessRun.stage == stage)
+        .filter(ProcessRun.status == "completed")
+        .order_by(ProcessRun.document_id != document.id, ProcessRun.finished_at.desc())
+        .first()
+    )
+    if match is None or match.document_id == document.id:
+        return match
+
+    output = json.loads(match.output_json) if match.output_json else {}
+    output["reused_from_run"] = match.id
+    now = dt.datetime.utcnow()
+    run = ProcessRun(
+        document_id=document.id,
+        stage=stage,
+        status="completed",
+        started_at=now,
+        finished_at=now,
+        output_json=json.dumps(output),
+        params_hash=key,
+    )
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+    return run
+
+
+def run_out(run: ProcessRun, output: Optional[Dict[str, Any]] = None) -> ProcessRunOut:
+    if output is None and run.output_json:
+        output = json.loads(run.output_json)
+    output = columnar_service.expand(output)
+    return ProcessRunOut(
+        id=run.id,
+        document_id=run.document_id,
+        stage=run.stage,
+        status=run.status,
+        started_at=run.started_at,
+        finished_at=run.finished_at,
+        output=output,
+    )
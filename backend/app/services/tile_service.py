@@ -0,0 +1,117 @@
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from PIL import Image, features
+
+TILE_SIZE = int(os.getenv("TILE_SIZE", "256"))
+TILE_OVERLAP = int(os.getenv("TILE_OVERLAP", "1"))
+TILE_FORMAT = os.getenv("TILE_FORMAT", "webp")  # "webp" or "jpeg"
+TILE_QUALITY = int(os.getenv("TILE_QUALITY", "80"))
+TILE_WORKERS = int(os.getenv("TILE_WORKERS", "0")) or os.cpu_count() or 1
+PREVIEW_MAX_EDGE = int(os.getenv("PREVIEW_MAX_EDGE", "1024"))
+
+_DZI_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+    'Format="{ext}" Overlap="{overlap}" TileSize="{tile_size}">\n'
+    '  <Size Width="{width}" Height="{height}"/>\n'
+    "</Image>\n"
+)
+
+
+def _resolve_format(fmt: str) -> str:
+    fmt = fmt.lower().strip()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in ("webp", "jpeg"):
+        raise RuntimeError(f"Unknown tile format '{fmt}'. Use 'webp' or 'jpeg'.")
+    if fmt == "webp" and not features.check("webp"):
+        return "jpeg"
+    return fmt
+
+
+def _save_tile(level_image, box, path: str, fmt: str, quality: int) -> None:
+    tile = level_image.crop(box)
+    if tile.mode not in ("RGB", "L"):
+        tile = tile.convert("RGB")
+    tile.save(path, fmt.upper(), quality=quality)
+
+
+def build_pyramid(
+    image,
+    out_dir: str,
+    name: str,
+    tile_size: int = TILE_SIZE,
+    overlap: int = TILE_OVERLAP,
+    fmt: str = TILE_FORMAT,
+    quality: int = TILE_QUALITY,
+    workers: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Write a Deep Zoom (DZI) tile pyramid and a low-res preview for one page image.
+
+    Layout follows the DZI convention: ``{name}.dzi`` plus
+    ``{name}_files/{level}/{col}_{row}.{ext}``, where the highest level is full
+    resolution and each level below halves it down to 1x1. Tiles are encoded on a
+    thread pool; Pillow releases the GIL while encoding.
+    """
+    fmt = _resolve_format(fmt)
+    ext = "jpg" if fmt == "jpeg" else fmt
+    width, height = image.size
+    max_level = int(math.ceil(math.log2(max(width, height, 1))))
+    files_dir = os.path.join(out_dir, f"{name}_files")
+
+    tile_count = 0
+    level_image = image
+    with ThreadPoolExecutor(max_workers=workers or TILE_WORKERS) as executor:
+        for level in range(max_level, -1, -1):
+            level_width, level_height = level_image.size
+            level_dir = os.path.join(files_dir, str(level))
+            os.makedirs(level_dir, exist_ok=True)
+            futures = []
+            for col in range(int(math.ceil(level_width / tile_size))):
+                for row in range(int(math.ceil(level_height / tile_size))):
+                    box = (
+                        max(0, col * tile_size - overlap),
+                        max(0, row * tile_size - overlap),
+                        min(level_width, (col + 1) * tile_size + overlap),
+                        min(level_height, (row + 1) * tile_size + overlap),
+                    )
+                    path = os.path.join(level_dir, f"{col}_{row}.{ext}")
+                    futures.append(
+                        executor.submit(_save_tile, level_image, box, path, fmt, quality)
+                    )
+            for future in futures:
+                future.result()
+            tile_count += len(futures)
+            if level:
+                level_image = level_image.resize(
+                    (max(1, (level_width + 1) // 2), max(1, (level_height + 1) // 2)),
+                    Image.BILINEAR,
+                )
+
+    dzi_path = os.path.join(out_dir, f"{name}.dzi")
+    with open(dzi_path, "w", encoding="utf-8") as handle:
+        handle.write(
+            _DZI_TEMPLATE.format(
+                ext=ext, overlap=overlap, tile_size=tile_size, width=width, height=height
+            )
+        )
+
+    preview = image.copy()
+    preview.thumbnail((PREVIEW_MAX_EDGE, PREVIEW_MAX_EDGE), Image.BILINEAR)
+    if preview.mode not in ("RGB", "L"):
+        preview = preview.convert("RGB")
+    preview_path = os.path.join(out_dir, f"{name}_preview.{ext}")
+    preview.save(preview_path, fmt.upper(), quality=quality)
+
+    return {
+        "dzi_path": dzi_path,
+        "preview_path": preview_path,
+        "tile_size": tile_size,
+        "overlap": overlap,
+        "format": ext,
+        "levels": max_level + 1,
+        "tile_count": tile_count,
+    }
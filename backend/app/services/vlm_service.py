@@ -1,22 +1,73 @@
+import asyncio
 import base64
+import email.utils
+import functools
+import hashlib
 import io
 import json
-import time
 import logging
-from typing import Any, Dict, List, Optional
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
 
 import httpx
-from pdf2image import convert_from_path
-import os
+from PIL import Image, ImageChops, features
+
+from . import cache_service, pdf_service
 
 logger = logging.getLogger(__name__)
 
-# Poppler path for Windows
-POPPLER_PATH = os.environ.get(
-    "POPPLER_PATH",
-    r"C:\Users\michael.martello\Downloads\poppler-install\poppler-25.07.0\Library\bin"
-)
+# Page requests in flight per run.
+VLM_CONCURRENCY = int(os.getenv("VLM_CONCURRENCY", "4"))
+# Retries on 429, 5xx and connection errors, with exponential backoff and jitter.
+# A Retry-After header, when present, wins over the computed delay.
+VLM_MAX_RETRIES = int(os.getenv("VLM_MAX_RETRIES", "4"))
+VLM_BACKOFF_BASE = float(os.getenv("VLM_BACKOFF_BASE", "1.0"))
+VLM_BACKOFF_MAX = float(os.getenv("VLM_BACKOFF_MAX", "60"))
+# Token bucket per provider: "rate" requests per second with bursts of "burst".
+# Providers without an entry are not rate limited. VLM_RATE_LIMITS (JSON) overrides.
+RATE_LIMITS: Dict[str, Dict[str, float]] = {
+    "openai": {"rate": 5.0, "burst": 5},
+}
+RATE_LIMITS.update(json.loads(os.getenv("VLM_RATE_LIMITS", "{}")))
+# Pooled provider clients: connection limits, keep-alive and request timeout in seconds.
+VLM_MAX_CONNECTIONS = int(os.getenv("VLM_MAX_CONNECTIONS", "20"))
+VLM_MAX_KEEPALIVE = int(os.getenv("VLM_MAX_KEEPALIVE", "10"))
+VLM_KEEPALIVE_EXPIRY = float(os.getenv("VLM_KEEPALIVE_EXPIRY", "60"))
+VLM_TIMEOUT = float(os.getenv("VLM_TIMEOUT", "120"))
+# HTTP/2 is used for https endpoints when the optional ``h2`` package is installed.
+VLM_HTTP2 = os.getenv("VLM_HTTP2", "1").lower() not in ("0", "false", "no")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+# Cached responses older than this are re-requested; 0 keeps them until evicted by size.
+VLM_CACHE_TTL_HOURS = float(os.getenv("VLM_CACHE_TTL_HOURS", "168"))
+CACHE_MODES = ("use", "bypass", "refresh")
+
+# Page encoding per provider, overridden per model name: "format" is auto, jpeg, webp
+# or png ("auto" keeps the smaller of PNG and JPEG), "quality" applies to the lossy
+# formats, "max_edge" caps the rendered raster and "max_bytes" lowers quality, then
+# size, until a page fits. VLM_ENCODE_PROFILES (JSON) overrides or adds entries,
+# e.g. {"llava:13b": {"max_edge": 1024}}.
+ENCODE_PROFILES: Dict[str, Dict[str, Any]] = {
+    "openai": {"format": "auto", "quality": 85},
+    "ollama": {"format": "auto", "quality": 85},
+}
+ENCODE_PROFILES.update(json.loads(os.getenv("VLM_ENCODE_PROFILES", "{}")))
+VLM_ENCODE_WORKERS = int(os.getenv("VLM_ENCODE_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+_MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+_MIN_ENCODE_QUALITY = 40
+_MIN_ENCODE_EDGE = 512
+
+# Generation settings sent with every request, part of the response cache key.
+_GEN_PARAMS: Dict[str, Dict[str, Any]] = {
+    "openai": {"max_tokens": 4096},
+    "ollama": {},
+}
+
 
+_loop_lock = threading.Lock()
 
 PROMPTS = {
     "general_notes": "Extract all general notes from this construction drawing. Include any specifications, requirements, abbreviations, and important callouts. Return as a structured list.",
@@ -27,89 +78,550 @@ PROMPTS = {
 }
 
 
-def _render_page_base64(image) -> str:
+def _resolve_format(fmt: str) -> str:
+    fmt = fmt.lower().strip()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt != "auto" and fmt not in _MIME_TYPES:
+        raise ValueError(f"Unknown image format '{fmt}'. Use 'auto', 'jpeg', 'webp' or 'png'.")
+    if fmt == "webp" and not features.check("webp"):
+        return "jpeg"
+    return fmt
+
+
+def encode_profile(
+    provider: str,
+    model: str,
+    image_format: Optional[str] = None,
+    quality: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Resolve how pages are encoded for ``model``. Raises ValueError for bad settings."""
+    profile = {"format": "png", "quality": None, "max_edge": None, "max_bytes": None}
+    profile.update(ENCODE_PROFILES.get(provider, {}))
+    profile.update(ENCODE_PROFILES.get(model, {}))
+    if image_format:
+        profile["format"] = image_format
+    if quality:
+        profile["quality"] = quality
+    profile["format"] = _resolve_format(profile["format"])
+    if profile["format"] == "png":
+        profile["quality"] = None
+    elif not 1 <= int(profile["quality"] or 0) <= 100:
+        raise ValueError("Image quality must be between 1 and 100.")
+    return profile
+
+
+def _is_gray(image) -> bool:
+    red, green, blue = image.split()[:3]
+    return (
+        ImageChops.difference(red, green).getbbox() is None
+        and ImageChops.difference(green, blue).getbbox() is None
+    )
+
+
+def _save(image, fmt: str, quality: Optional[int]) -> bytes:
     buffer = io.BytesIO()
-    image.save(buffer, format="PNG")
-    return base64.b64encode(buffer.getvalue()).decode("ascii")
-
-
-def _render_all_pages_base64(pdf_path: str, dpi: int = 200) -> List[Dict[str, Any]]:
-    images = convert_from_path(pdf_path, dpi=dpi, poppler_path=POPPLER_PATH)
-    if not images:
-        raise RuntimeError("Failed to render PDF pages.")
-    pages = []
-    for index, image in enumerate(images, start=1):
-        pages.append({
-            "page": index,
-            "width": image.width,
-            "height": image.height,
-            "base64": _render_page_base64(image),
-        })
-    return pages
-
-
-def _run_openai(image_b64: str, prompt: str, model: str, api_key: str) -> Dict[str, Any]:
-    """Run vision request using OpenAI API."""
-    from openai import OpenAI
+    if fmt == "png":
+        image.save(buffer, format="PNG")
+    else:
+        image.save(buffer, format=fmt.upper(), quality=quality)
+    return buffer.getvalue()
 
-    if not api_key:
-        raise RuntimeError("OpenAI API key is required. Please enter your API key.")
 
-    print(f"[OpenAI] Starting request: model={model}, prompt_length={len(prompt)}, image_size={len(image_b64)}")
+def _encode_page(image, encoding: Dict[str, Any]) -> Dict[str, Any]:
+    """Encode one page, lowering quality and then size until it fits ``max_bytes``.
 
+    Pages without colour are sent as 8-bit grayscale. ``auto`` keeps the smaller of
+    PNG (sparse line work) and JPEG (scans, shading).
+    """
+    quality = encoding["quality"]
+    budget = encoding.get("max_bytes")
+    formats = ("png", "jpeg") if encoding["format"] == "auto" else (encoding["format"],)
+    if image.mode == "RGB" and _is_gray(image):
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    while True:
+        fmt, data = min(
+            ((fmt, _save(image, fmt, quality)) for fmt in formats), key=lambda pair: len(pair[1])
+        )
+        if not budget or len(data) <= budget or max(image.size) <= _MIN_ENCODE_EDGE:
+            break
+        if fmt != "png" and quality > _MIN_ENCODE_QUALITY:
+            quality = max(_MIN_ENCODE_QUALITY, quality - 10)
+        else:
+            image = image.resize(
+                (max(1, image.width * 3 // 4), max(1, image.height * 3 // 4)), Image.BILINEAR
+            )
+    return {
+        "base64": base64.b64encode(data).decode("ascii"),
+        "mime": _MIME_TYPES[fmt],
+        "format": fmt,
+        "bytes": len(data),
+    }
+
+
+_encode_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _encode_pool() -> ThreadPoolExecutor:
+    global _encode_executor
+    with _loop_lock:
+        if _encode_executor is None:
+            _encode_executor = ThreadPoolExecutor(
+                max_workers=VLM_ENCODE_WORKERS, thread_name_prefix="vlm-encode"
+            )
+        return _encode_executor
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    """Background event loop shared by all VLM runs (routes run in worker threads)."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="vlm-event-loop", daemon=True).start()
+        return _loop
+
+
+# Long-lived clients keyed by (provider, base URL, api key). They belong to the
+# background loop and are only created and used from coroutines running on it.
+_clients: Dict[Tuple[str, str, str], Any] = {}
+
+
+def _http2_available() -> bool:
+    if not VLM_HTTP2:
+        return False
     try:
-        # Use custom httpx client to bypass SSL verification (for corporate networks)
-        http_client = httpx.Client(verify=False)
-        client = OpenAI(api_key=api_key, http_client=http_client)
-
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"Respond in JSON only. {prompt}",
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{image_b64}",
-                            },
-                        },
-                    ],
-                }
-            ],
-            max_tokens=4096,
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _http_client(**kwargs) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=VLM_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=VLM_MAX_CONNECTIONS,
+            max_keepalive_connections=VLM_MAX_KEEPALIVE,
+            keepalive_expiry=VLM_KEEPALIVE_EXPIRY,
+        ),
+        http2=_http2_available(),
+        **kwargs,
+    )
+
+
+def _ollama_client(ollama_url: str) -> httpx.AsyncClient:
+    key = ("ollama", ollama_url.rstrip("/"), "")
+    client = _clients.get(key)
+    if client is None:
+        client = _clients[key] = _http_client(base_url=key[1])
+    return client
+
+
+def _openai_client(api_key: str):
+    from openai import AsyncOpenAI
+
+    key = ("openai", OPENAI_BASE_URL, api_key)
+    client = _clients.get(key)
+    if client is None:
+        # Use custom httpx client to bypass SSL verification (for corporate networks).
+        # Retries are handled by _with_retries so they share the provider's rate limit.
+        client = _clients[key] = AsyncOpenAI(
+            api_key=api_key,
+            base_url=OPENAI_BASE_URL,
+            http_client=_http_client(verify=False),
+            max_retries=0,
         )
+    return client
+
+
+async def _close_clients() -> None:
+    clients = list(_clients.values())
+    _clients.clear()
+    _buckets.clear()
+    for client in clients:
+        try:
+            if isinstance(client, httpx.AsyncClient):
+                await client.aclose()
+            else:
+                await client.close()
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Failed to close VLM client: %s", exc)
+
+
+def close_clients(timeout: float = 10.0) -> None:
+    """Close pooled provider connections, the encode pool and the background loop."""
+    global _loop, _encode_executor
+    with _loop_lock:
+        loop, _loop = _loop, None
+        executor, _encode_executor = _encode_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False)
+    if loop is None:
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_close_clients(), loop).result(timeout)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+
+
+def _request_prompt(prompt: str) -> str:
+    return f"Respond in JSON only. {prompt}"
 
-        print(f"[OpenAI] Success: usage={response.usage}")
-        text = response.choices[0].message.content
-        return _parse_vlm_response(text)
-    except Exception as e:
-        print(f"[OpenAI] Error: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
-        raise
 
+def _ms(start: float, stop: Optional[float] = None) -> Optional[int]:
+    if stop is None:
+        return None
+    return int((stop - start) * 1000)
 
-def _run_ollama(image_b64: str, prompt: str, model: str, ollama_url: str) -> Dict[str, Any]:
+
+def _ns_ms(value: Optional[int]) -> Optional[int]:
+    return int(value / 1_000_000) if value is not None else None
+
+
+async def _run_openai(
+    image_b64: str, prompt: str, model: str, api_key: str, mime: str = "image/png"
+) -> Dict[str, Any]:
+    """Run vision request using OpenAI API."""
+    if not api_key:
+        raise RuntimeError("OpenAI API key is required. Please enter your API key.")
+
+    logger.debug(
+        "OpenAI request: model=%s prompt_length=%d image_size=%d",
+        model,
+        len(prompt),
+        len(image_b64),
+    )
+    # Streamed so time to first token can be measured; usage arrives in the last chunk.
+    start = time.perf_counter()
+    first_token = None
+    usage = None
+    parts: List[str] = []
+    stream = await _openai_client(api_key).chat.completions.create(
+        model=model,
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": _request_prompt(prompt),
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{mime};base64,{image_b64}",
+                        },
+                    },
+                ],
+            }
+        ],
+        stream=True,
+        stream_options={"include_usage": True},
+        **_GEN_PARAMS["openai"],
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            if first_token is None:
+                first_token = time.perf_counter()
+            parts.append(chunk.choices[0].delta.content)
+        if chunk.usage is not None:
+            usage = chunk.usage
+
+    logger.debug("OpenAI usage: %s", usage)
+    output = _parse_vlm_response("".join(parts))
+    output["telemetry"] = {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "load_ms": None,
+        "prompt_eval_ms": None,
+        "eval_ms": None,
+        "ttft_ms": _ms(start, first_token),
+        "latency_ms": _ms(start, time.perf_counter()),
+    }
+    return output
+
+
+async def _run_ollama(image_b64: str, prompt: str, model: str, ollama_url: str) -> Dict[str, Any]:
     """Run vision request using Ollama API."""
     payload = {
         "model": model,
-        "prompt": f"Respond in JSON only. {prompt}",
+        "prompt": _request_prompt(prompt),
         "images": [image_b64],
-        "stream": False,
+        "stream": True,
+        **_GEN_PARAMS["ollama"],
     }
 
-    with httpx.Client(timeout=120) as client:
-        response = client.post(f"{ollama_url}/api/generate", json=payload)
+    # Streamed so time to first token can be measured; the final ("done") chunk
+    # carries token counts and server-side durations in nanoseconds.
+    start = time.perf_counter()
+    first_token = None
+    final: Dict[str, Any] = {}
+    parts: List[str] = []
+    async with _ollama_client(ollama_url).stream("POST", "/api/generate", json=payload) as response:
         response.raise_for_status()
-        data = response.json()
+        async for line in response.aiter_lines():
+            if not line.strip():
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                raise RuntimeError(f"Ollama error: {chunk['error']}")
+            if chunk.get("response"):
+                if first_token is None:
+                    first_token = time.perf_counter()
+                parts.append(chunk["response"])
+            if chunk.get("done"):
+                final = chunk
+
+    output = _parse_vlm_response("".join(parts))
+    output["telemetry"] = {
+        "prompt_tokens": final.get("prompt_eval_count"),
+        "completion_tokens": final.get("eval_count"),
+        "load_ms": _ns_ms(final.get("load_duration")),
+        "prompt_eval_ms": _ns_ms(final.get("prompt_eval_duration")),
+        "eval_ms": _ns_ms(final.get("eval_duration")),
+        "ttft_ms": _ms(start, first_token),
+        "latency_ms": _ms(start, time.perf_counter()),
+    }
+    return output
+
+
+class _TokenBucket:
+    """Async token bucket; ``acquire`` waits until a request may be sent."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Only touched from the event loop thread.
+_buckets: Dict[str, _TokenBucket] = {}
+
+
+def _bucket(provider: str) -> Optional[_TokenBucket]:
+    limit = RATE_LIMITS.get(provider) or {}
+    if not limit.get("rate"):
+        return None
+    if provider not in _buckets:
+        _buckets[provider] = _TokenBucket(float(limit["rate"]), float(limit.get("burst", 1)))
+    return _buckets[provider]
+
+
+def _retry_after(headers) -> Optional[float]:
+    value = headers.get("retry-after") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def _retry_delay(exc: Exception, attempt: int) -> Optional[float]:
+    """Seconds to wait before retrying ``exc``, or None when it should not be retried."""
+    response = getattr(exc, "response", None)
+    status = getattr(exc, "status_code", None) or getattr(response, "status_code", None)
+    if status is not None:
+        if status != 429 and status < 500:
+            return None
+    elif not isinstance(exc, httpx.TransportError) and type(exc).__name__ not in (
+        "APIConnectionError",
+        "APITimeoutError",
+    ):
+        return None
+    delay = _retry_after(getattr(response, "headers", None))
+    if delay is None:
+        delay = VLM_BACKOFF_BASE * (2**attempt) * random.uniform(0.5, 1.0)
+    return min(delay, VLM_BACKOFF_MAX)
+
 
-    text = data.get("response", "")
-    return _parse_vlm_response(text)
+async def _with_retries(
+    provider: str, call: Callable[[], Awaitable[Dict[str, Any]]]
+) -> Dict[str, Any]:
+    """Call with rate limiting and retries; waits are added to the output's telemetry."""
+    bucket = _bucket(provider)
+    rate_limit_ms = backoff_ms = 0
+    for attempt in range(VLM_MAX_RETRIES + 1):
+        if bucket is not None:
+            wait_start = time.perf_counter()
+            await bucket.acquire()
+            rate_limit_ms += _ms(wait_start, time.perf_counter())
+        try:
+            output = await call()
+        except Exception as exc:
+            delay = _retry_delay(exc, attempt)
+            if delay is None or attempt == VLM_MAX_RETRIES:
+                raise
+            logger.warning(
+                "%s request failed (%s); retry %d in %.1fs", provider, exc, attempt + 1, delay
+            )
+            await asyncio.sleep(delay)
+            backoff_ms += int(delay * 1000)
+            continue
+        output["attempts"] = attempt + 1
+        telemetry = output.setdefault("telemetry", {})
+        telemetry["rate_limit_ms"] = rate_limit_ms
+        telemetry["backoff_ms"] = backoff_ms
+        return output
+    raise RuntimeError("unreachable")
+
+
+def _page_done(on_page: Callable[[Dict[str, Any]], None], future: Future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        on_page(future.result())
+
+
+async def _tracked(tasks: Set[asyncio.Task], coro: Awaitable[Dict[str, Any]]) -> Dict[str, Any]:
+    task = asyncio.current_task()
+    tasks.add(task)
+    try:
+        return await coro
+    finally:
+        tasks.discard(task)
+
+
+def parse_cache_mode(mode: Optional[str]) -> str:
+    """Normalize a request's ``cache`` mode. Raises ValueError for unknown modes."""
+    mode = (mode or "use").lower().strip()
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode '{mode}'. Use one of: {', '.join(CACHE_MODES)}.")
+    return mode
+
+
+def _cache_key(
+    raster: str, prompt: str, provider: str, model: str, encoding: Dict[str, Any]
+) -> str:
+    """Response cache key; ``raster`` is the page's :func:`cache_service.image_digest`."""
+    payload = json.dumps(
+        {
+            "raster": raster,
+            "encoding": encoding,
+            "prompt": _request_prompt(prompt),
+            "provider": provider,
+            "model": model,
+            "params": _GEN_PARAMS[provider],
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _cache_get(key: str) -> Optional[Dict[str, Any]]:
+    cache = cache_service.get_vlm_cache()
+    data = cache.get_bytes(key)
+    if data is None:
+        return None
+    try:
+        entry = json.loads(data)
+        created, output = entry["created"], entry["output"]
+    except (ValueError, KeyError, TypeError):
+        cache.delete(key)
+        return None
+    if VLM_CACHE_TTL_HOURS > 0 and time.time() - created > VLM_CACHE_TTL_HOURS * 3600:
+        cache.delete(key)
+        return None
+    return output
+
+
+def _cache_put(key: str, output: Dict[str, Any]) -> None:
+    output = {name: value for name, value in output.items() if name != "attempts"}
+    entry = {"created": time.time(), "output": output}
+    cache_service.get_vlm_cache().put_bytes(key, json.dumps(entry).encode("utf-8"))
+
+
+class _SharedEncoding:
+    """One page's encoded image, produced once in the worker pool for every prompt.
+
+    The encode task sits in ``tasks`` until it finishes, so the run can cancel it
+    along with its requests.
+    """
+
+    def __init__(self, image, encoding: Dict[str, Any], tasks: Set[asyncio.Task]):
+        self.image = image
+        self.encoding = encoding
+        self.tasks = tasks
+        self._task: Optional[asyncio.Future] = None
+
+    async def get(self) -> Dict[str, Any]:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._encode())
+            self.tasks.add(self._task)
+            self._task.add_done_callback(self.tasks.discard)
+        # Shielded so a cancelled prompt does not cancel the encode for the others.
+        return await asyncio.shield(self._task)
+
+    async def _encode(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        encoded = await asyncio.get_running_loop().run_in_executor(
+            _encode_pool(), _encode_page, self.image, self.encoding
+        )
+        self.image = None
+        encoded["encode_ms"] = int((time.perf_counter() - start) * 1000)
+        return encoded
+
+
+async def _run_page(
+    semaphore: asyncio.Semaphore,
+    page_info: Dict[str, Any],
+    shared: _SharedEncoding,
+    provider: str,
+    prompt: str,
+    model: str,
+    api_key: Optional[str],
+    ollama_url: str,
+) -> Dict[str, Any]:
+    # Encoding runs in the worker pool, overlapping with other pages' requests.
+    encoded = await shared.get()
+    queued = time.perf_counter()
+    async with semaphore:
+        page_start = time.perf_counter()
+        if provider == "openai":
+            output = await _with_retries(
+                provider,
+                lambda: _run_openai(encoded["base64"], prompt, model, api_key, encoded["mime"]),
+            )
+        else:
+            output = await _with_retries(
+                provider, lambda: _run_ollama(encoded["base64"], prompt, model, ollama_url)
+            )
+        page_elapsed = int((time.perf_counter() - page_start) * 1000)
+    # Telemetry describes this request only, so it stays out of the cached output.
+    telemetry = output.pop("telemetry", {})
+    telemetry["queue_ms"] = _ms(queued, page_start) + telemetry.get("rate_limit_ms", 0)
+    return {
+        **page_info,
+        "output": output,
+        "telemetry": telemetry,
+        "elapsed_ms": page_elapsed,
+        "encode_ms": encoded["encode_ms"],
+        "format": encoded["format"],
+        "bytes": encoded["bytes"],
+        "cached": False,
+    }
 
 
 def _parse_vlm_response(text: str) -> Dict[str, Any]:
@@ -127,52 +639,193 @@ def _parse_vlm_response(text: str) -> Dict[str, Any]:
     return output
 
 
-def run_vlm(
+def resolve_prompt(prompt_key: str, custom_prompt: Optional[str] = None) -> str:
+    if prompt_key not in PROMPTS:
+        raise RuntimeError(f"Unknown prompt_key '{prompt_key}'.")
+    if prompt_key == "custom" and custom_prompt:
+        return custom_prompt
+    prompt = PROMPTS[prompt_key]
+    if not prompt and prompt_key == "custom":
+        raise RuntimeError("Custom prompt is required when using 'custom' prompt type.")
+    return prompt
+
+
+def _release_after(count: int, release: Callable[[], None]) -> Callable[[Future], None]:
+    """Done callback that calls ``release`` once ``count`` futures have finished."""
+    lock = threading.Lock()
+    left = [count]
+
+    def done(_: Future) -> None:
+        with lock:
+            left[0] -= 1
+            last = left[0] == 0
+        if last:
+            release()
+
+    return done
+
+
+def _failed(futures: List[Future]) -> bool:
+    return any(
+        future.done() and not future.cancelled() and future.exception() is not None
+        for future in futures
+    )
+
+
+def run_vlm_prompts(
     pdf_path: str,
-    prompt_key: str,
+    prompts: List[Tuple[str, str]],
     model: str = "gpt-4o",
     provider: str = "openai",
     api_key: str = None,
     ollama_url: str = "http://localhost:11434",
     max_pages: Optional[int] = None,
-    custom_prompt: Optional[str] = None,
-) -> Dict[str, Any]:
-    if prompt_key not in PROMPTS:
-        raise RuntimeError(f"Unknown prompt_key '{prompt_key}'.")
+    pages: Optional[List[int]] = None,
+    dpi: Optional[int] = None,
+    max_edge: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    cache: str = "use",
+    image_format: Optional[str] = None,
+    quality: Optional[int] = None,
+    on_page: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+) -> List[Union[Dict[str, Any], Exception]]:
+    """Run several ``(prompt_key, prompt)`` pairs over one render of the selected pages.
 
+    Each page is rendered and encoded once; its requests for every prompt share the
+    run's concurrency limit. Returns one output per prompt, in order, or the
+    exception that failed it; a failing prompt does not stop the others.
+    ``on_page(index, page)`` is called with each page as soon as prompt ``index``
+    has its answer.
+    """
     start_time = time.perf_counter()
-    all_pages = _render_all_pages_base64(pdf_path)
+    if max_pages is not None and max_pages > 0:
+        if pages is None:
+            pages = list(range(1, pdf_service.page_count(pdf_path) + 1))
+        pages = pages[:max_pages]
+    if provider not in ("openai", "ollama"):
+        raise RuntimeError(f"Unknown provider '{provider}'. Use 'openai' or 'ollama'.")
+    cache = parse_cache_mode(cache)
+    encoding = encode_profile(provider, model, image_format, quality)
+    profile = pdf_service.render_profile(provider, dpi, max_edge or encoding["max_edge"])
 
-    if prompt_key == "custom" and custom_prompt:
-        prompt = custom_prompt
-    else:
-        prompt = PROMPTS[prompt_key]
-        if not prompt and prompt_key == "custom":
-            raise RuntimeError("Custom prompt is required when using 'custom' prompt type.")
+    # Pages are rendered on this thread and their requests run concurrently on the
+    # shared event loop; rendering stays at most 2 * concurrency pages ahead. Cached
+    # pages are answered here and never encoded.
+    concurrency = max(1, concurrency or VLM_CONCURRENCY)
+    loop = _event_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    ahead = threading.BoundedSemaphore(concurrency * 2)
+    futures: List[List[Future]] = [[] for _ in prompts]
+    tasks: List[Set[asyncio.Task]] = [set() for _ in prompts]
+    encodes: Set[asyncio.Task] = set()
+    keys: Dict[Tuple[int, int], str] = {}
+    results: List[Union[Dict[str, Any], Exception]] = []
+    try:
+        for number, image in pdf_service.iter_pages(
+            pdf_path, dpi=profile["dpi"], pages=pages, max_edge=profile["max_edge"]
+        ):
+            page_info = {"page": number, "width": image.width, "height": image.height}
+            # Hashed once per page, like the encode, however many prompts read it.
+            digest = cache_service.image_digest(image) if cache != "bypass" else None
+            pending = []
+            for index, (_, prompt) in enumerate(prompts):
+                if _failed(futures[index]):
+                    continue
+                if cache != "bypass":
+                    page_start = time.perf_counter()
+                    key = _cache_key(digest, prompt, provider, model, encoding)
+                    output = _cache_get(key) if cache == "use" else None
+                    if output is not None:
+                        future: Future = Future()
+                        future.set_result(
+                            {
+                                **page_info,
+                                "output": {**output, "attempts": 0},
+                                "elapsed_ms": int((time.perf_counter() - page_start) * 1000),
+                                "cached": True,
+                            }
+                        )
+                        futures[index].append(future)
+                        if on_page:
+                            on_page(index, future.result())
+                        continue
+                    keys[(index, number)] = key
+                pending.append(index)
+            if not pending:
+                continue
 
-    if max_pages is not None and max_pages > 0:
-        all_pages = all_pages[:max_pages]
+            shared = _SharedEncoding(image, encoding, encodes)
+            image = None
+            ahead.acquire()
+            release = _release_after(len(pending), ahead.release)
+            for index in pending:
+                future = asyncio.run_coroutine_threadsafe(
+                    _tracked(
+                        tasks[index],
+                        _run_page(
+                            semaphore,
+                            page_info,
+                            shared,
+                            provider,
+                            prompts[index][1],
+                            model,
+                            api_key,
+                            ollama_url,
+                        ),
+                    ),
+                    loop,
+                )
+                future.add_done_callback(release)
+                if on_page:
+                    future.add_done_callback(
+                        functools.partial(_page_done, functools.partial(on_page, index))
+                    )
+                futures[index].append(future)
+            shared = None
+            if all(_failed(prompt_futures) for prompt_futures in futures):
+                break
 
-    pages_output = []
-    for page_info in all_pages:
-        page_start = time.perf_counter()
-        if provider == "openai":
-            output = _run_openai(page_info["base64"], prompt, model, api_key)
-        elif provider == "ollama":
-            output = _run_ollama(page_info["base64"], prompt, model, ollama_url)
-        else:
-            raise RuntimeError(f"Unknown provider '{provider}'. Use 'openai' or 'ollama'.")
-        page_elapsed = int((time.perf_counter() - page_start) * 1000)
-        pages_output.append({
-            "page": page_info["page"],
-            "width": page_info["width"],
-            "height": page_info["height"],
-            "output": output,
-            "elapsed_ms": page_elapsed,
-        })
+        for index in range(len(prompts)):
+            try:
+                results.append([future.result() for future in futures[index]])
+            except Exception as exc:
+                results.append(exc)
+                for task in list(tasks[index]):
+                    loop.call_soon_threadsafe(task.cancel)
+    finally:
+        # Requests and encodes still in flight after a failure are cancelled on the loop.
+        for prompt_tasks in [*tasks, encodes]:
+            for task in list(prompt_tasks):
+                loop.call_soon_threadsafe(task.cancel)
+        for index, prompt_futures in enumerate(futures):
+            for future in prompt_futures:
+                if not future.done() or future.cancelled() or future.exception() is not None:
+                    continue
+                page = future.result()
+                if (index, page["page"]) in keys and not page["cached"]:
+                    _cache_put(keys[(index, page["page"])], page["output"])
 
     total_elapsed = int((time.perf_counter() - start_time) * 1000)
+    return [
+        result
+        if isinstance(result, Exception)
+        else _vlm_output(
+            prompts[index], result, provider, model, profile, encoding, concurrency, total_elapsed
+        )
+        for index, result in enumerate(results)
+    ]
 
+
+def _vlm_output(
+    prompt: Tuple[str, str],
+    pages_output: List[Dict[str, Any]],
+    provider: str,
+    model: str,
+    profile: Dict[str, Any],
+    encoding: Dict[str, Any],
+    concurrency: int,
+    total_elapsed: int,
+) -> Dict[str, Any]:
     combined_parsed = []
     for page in pages_output:
         if page["output"].get("parsed"):
@@ -184,12 +837,105 @@ def run_vlm(
     return {
         "provider": provider,
         "model": model,
-        "prompt_key": prompt_key,
-        "prompt": prompt,
+        "prompt_key": prompt[0],
+        "prompt": prompt[1],
+        "render": profile,
+        "encoding": encoding,
         "pages": pages_output,
         "parsed": combined_parsed if combined_parsed else None,
         "metrics": {
             "page_count": len(pages_output),
             "elapsed_ms": total_elapsed,
+            "concurrency": concurrency,
+            "retries": sum(
+                page["output"]["attempts"] - 1 for page in pages_output if not page["cached"]
+            ),
+            "cached_pages": sum(1 for page in pages_output if page["cached"]),
+            "computed_pages": sum(1 for page in pages_output if not page["cached"]),
+            "payload_bytes": sum(page.get("bytes", 0) for page in pages_output),
+            "encode_ms": sum(page.get("encode_ms", 0) for page in pages_output),
+            **_telemetry_summary(pages_output),
         },
     }
+
+
+def _percentile(values: List[int], fraction: float) -> Optional[int]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def _telemetry_summary(pages_output: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Run-level token totals and latency stats over the pages that were requested."""
+    telemetry = [page["telemetry"] for page in pages_output if page.get("telemetry")]
+
+    def values(name: str) -> List[int]:
+        return [entry[name] for entry in telemetry if entry.get(name) is not None]
+
+    def total(name: str) -> Optional[int]:
+        found = values(name)
+        return sum(found) if found else None
+
+    def average(name: str) -> Optional[int]:
+        found = values(name)
+        return int(sum(found) / len(found)) if found else None
+
+    return {
+        "prompt_tokens": total("prompt_tokens"),
+        "completion_tokens": total("completion_tokens"),
+        "load_ms": total("load_ms"),
+        "max_load_ms": max(values("load_ms"), default=None),
+        "avg_queue_ms": average("queue_ms"),
+        "avg_ttft_ms": average("ttft_ms"),
+        "p95_ttft_ms": _percentile(values("ttft_ms"), 0.95),
+        "avg_latency_ms": average("latency_ms"),
+        "p50_latency_ms": _percentile(values("latency_ms"), 0.5),
+        "p95_latency_ms": _percentile(values("latency_ms"), 0.95),
+    }
+
+
+def run_vlm(
+    pdf_path: str,
+    prompt_key: str,
+    model: str = "gpt-4o",
+    provider: str = "openai",
+    api_key: str = None,
+    ollama_url: str = "http://localhost:11434",
+    max_pages: Optional[int] = None,
+    custom_prompt: Optional[str] = None,
+    pages: Optional[List[int]] = None,
+    dpi: Optional[int] = None,
+    max_edge: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    cache: str = "use",
+    image_format: Optional[str] = None,
+    quality: Optional[int] = None,
+    on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """Run one prompt over the selected pages.
+
+    ``on_page`` is called with each page as soon as it is answered, in completion
+    order, from the render thread for cached pages and the event loop otherwise.
+    """
+    prompt = resolve_prompt(prompt_key, custom_prompt)
+    (output,) = run_vlm_prompts(
+        pdf_path,
+        [(prompt_key, prompt)],
+        model=model,
+        provider=provider,
+        api_key=api_key,
+        ollama_url=ollama_url,
+        max_pages=max_pages,
+        pages=pages,
+        dpi=dpi,
+        max_edge=max_edge,
+        concurrency=concurrency,
+        cache=cache,
+        image_format=image_format,
+        quality=quality,
+        on_page=(lambda _, page: on_page(page)) if on_page else None,
+    )
+    if isinstance(output, Exception):
+        raise output
+    return output
@@ -0,0 +1,163 @@
+"""VLM throughput benchmark against the mock server.
+
+Drives ``vlm_service.run_vlm`` over a synthetic drawing set (or ``--pdf``) at each
+``--concurrency`` level and reports pages/sec, p50/p95 request latency, retries
+and scaling relative to the first level. The response cache is bypassed; rasters
+are rendered once in a warm-up run so every level measures the request path.
+
+    python -m backend.scripts.bench_vlm --pages 24 --concurrency 1,2,4,8 --seed 1
+
+Mock options (``--latency``, ``--error-rate``, ...) are the same as for
+``backend.scripts.mock_vlm``; ``--url`` benchmarks a server that is already running.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from PIL import Image, ImageDraw
+
+from .mock_vlm import MockServer, add_arguments, settings_from_args
+
+
+def synthetic_pdf(path: str, pages: int, size=(1700, 1100)) -> str:
+    """Write a PDF of line-art sheets (grid, boxes, title block), one per page."""
+    sheets = []
+    for number in range(pages):
+        sheet = Image.new("L", size, 255)
+        draw = ImageDraw.Draw(sheet)
+        width, height = size
+        draw.rectangle([20, 20, width - 20, height - 20], outline=0, width=4)
+        for x in range(100, width - 300, 120):
+            draw.line([x, 60, x, height - 60], fill=160, width=1)
+        for y in range(80, height - 60, 90):
+            draw.line([60, y, width - 320, y], fill=160, width=1)
+        for index in range(6 + number % 5):
+            left = 120 + (index * 197 + number * 53) % (width - 600)
+            top = 100 + (index * 131 + number * 71) % (height - 300)
+            draw.rectangle([left, top, left + 160, top + 110], outline=0, width=3)
+            draw.text((left + 10, top + 10), f"RM {number + 1}{index:02d}", fill=0)
+        draw.rectangle([width - 300, height - 220, width - 40, height - 40], outline=0, width=3)
+        draw.text((width - 280, height - 200), f"SHEET A-{number + 1:03d}", fill=0)
+        sheets.append(sheet)
+    sheets[0].save(path, "PDF", resolution=150, save_all=True, append_images=sheets[1:])
+    return path
+
+
+def parse_levels(value: str) -> List[int]:
+    try:
+        levels = [int(level) for level in value.split(",") if level.strip()]
+    except ValueError:
+        levels = []
+    if not levels or min(levels) < 1:
+        raise argparse.ArgumentTypeError("Use comma-separated positive integers, e.g. 1,2,4,8.")
+    return levels
+
+
+def run_level(vlm_service, args, pdf_path: str, concurrency: int) -> Dict[str, Any]:
+    start = time.perf_counter()
+    output = vlm_service.run_vlm(
+        pdf_path,
+        args.prompt_key,
+        model=args.model,
+        provider=args.provider,
+        api_key="mock",
+        ollama_url=args.url,
+        max_pages=args.max_pages,
+        concurrency=concurrency,
+        cache="bypass",
+    )
+    wall = time.perf_counter() - start
+    metrics = output["metrics"]
+    return {
+        "concurrency": concurrency,
+        "pages": metrics["page_count"],
+        "wall_s": round(wall, 3),
+        "pages_per_s": round(metrics["page_count"] / wall, 2) if wall else None,
+        "p50_latency_ms": metrics.get("p50_latency_ms"),
+        "p95_latency_ms": metrics.get("p95_latency_ms"),
+        "avg_ttft_ms": metrics.get("avg_ttft_ms"),
+        "avg_queue_ms": metrics.get("avg_queue_ms"),
+        "retries": metrics.get("retries"),
+        "encode_ms": metrics.get("encode_ms"),
+    }
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    columns = [
+        ("concurrency", "conc"),
+        ("pages", "pages"),
+        ("wall_s", "wall s"),
+        ("pages_per_s", "pages/s"),
+        ("scaling", "scaling"),
+        ("p50_latency_ms", "p50 ms"),
+        ("p95_latency_ms", "p95 ms"),
+        ("avg_ttft_ms", "ttft ms"),
+        ("avg_queue_ms", "queue ms"),
+        ("retries", "retries"),
+    ]
+    rows = [[label for _, label in columns]]
+    rows += [
+        ["-" if result.get(key) is None else str(result[key]) for key, _ in columns]
+        for result in results
+    ]
+    widths = [max(len(row[index]) for row in rows) for index in range(len(columns))]
+    for row in rows:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--pdf", help="PDF to send (default: a synthetic drawing set)")
+    parser.add_argument("--pages", type=int, default=16, help="Pages in the synthetic PDF")
+    parser.add_argument("--max-pages", type=int, default=None)
+    parser.add_argument("--concurrency", type=parse_levels, default=parse_levels("1,2,4,8"))
+    parser.add_argument("--provider", choices=["ollama", "openai"], default="ollama")
+    parser.add_argument("--model", default="mock-vl")
+    parser.add_argument("--prompt-key", default="drawing_contents")
+    parser.add_argument("--url", help="Use a running server instead of starting the mock")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-vlm-")
+    # Keep the benchmark's rasters and responses out of the app's data directory.
+    os.environ.setdefault("CACHE_DIR", os.path.join(workdir, "cache"))
+    from ..app.services import vlm_service
+
+    server = None
+    if not args.url:
+        try:
+            server = MockServer(settings_from_args(args)).start()
+        except ValueError as exc:
+            parser.error(str(exc))
+        args.url = server.url
+    # The OpenAI client reads the base URL per client, so point it at the server.
+    vlm_service.OPENAI_BASE_URL = f"{args.url.rstrip('/')}/v1"
+
+    pdf_path = args.pdf or synthetic_pdf(os.path.join(workdir, "synthetic.pdf"), args.pages)
+    try:
+        run_level(vlm_service, args, pdf_path, max(args.concurrency))
+        results = [run_level(vlm_service, args, pdf_path, level) for level in args.concurrency]
+    finally:
+        vlm_service.close_clients()
+        if server is not None:
+            server.stop()
+
+    baseline = results[0]["pages_per_s"]
+    for result in results:
+        result["scaling"] = round(result["pages_per_s"] / baseline, 2) if baseline else None
+    print(f"{args.provider} {args.model} via {args.url}: {results[0]['pages']} pages per level")
+    print_table(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as handle:
+            json.dump({"settings": vars(args), "results": results}, handle, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
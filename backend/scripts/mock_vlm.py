@@ -0,0 +1,356 @@
+"""Stand-in VLM server for offline runs and benchmarks.
+
+Implements the parts of the Ollama ``/api/generate`` and OpenAI
+``/v1/chat/completions`` APIs that ``vlm_service`` uses, streaming and not, with
+configurable latency, errors and a canned JSON answer.
+
+    python -m backend.scripts.mock_vlm --port 11434 --latency lognormal:800,0.4
+
+Latency specs are ``fixed:ms``, ``uniform:low,high``, ``normal:mean,sd`` or
+``lognormal:median,sigma`` (milliseconds).
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_RESPONSE = {
+    "drawing_type": "floor plan",
+    "notes": ["Verify all dimensions in field.", "See structural drawings for framing."],
+    "codes": ["IBC 2021", "ASTM A992"],
+}
+
+
+class Latency:
+    """Random delay in milliseconds drawn from a ``kind:params`` spec."""
+
+    KINDS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+
+    def __init__(self, spec: str):
+        kind, _, params = spec.partition(":")
+        kind = kind.strip().lower()
+        try:
+            values = [float(value) for value in params.split(",") if value.strip()]
+        except ValueError:
+            values = []
+        if kind not in self.KINDS or len(values) != self.KINDS[kind]:
+            raise ValueError(
+                f"Invalid latency '{spec}'. Use fixed:ms, uniform:low,high, "
+                "normal:mean,sd or lognormal:median,sigma."
+            )
+        self.spec = spec
+        self.kind = kind
+        self.values = values
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            value = self.values[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(*self.values)
+        elif self.kind == "normal":
+            value = rng.gauss(*self.values)
+        else:
+            value = rng.lognormvariate(math.log(self.values[0]), self.values[1])
+        return max(0.0, value)
+
+
+class MockSettings:
+    """What the mock answers and how slowly; see :func:`add_arguments` for the options."""
+
+    def __init__(
+        self,
+        latency: str = "lognormal:800,0.4",
+        ttft: str = "uniform:100,300",
+        load_ms: float = 0.0,
+        error_rate: float = 0.0,
+        error_statuses: Optional[List[int]] = None,
+        retry_after: Optional[float] = None,
+        response: Optional[Dict[str, Any]] = None,
+        chunks: int = 8,
+        parallel: int = 0,
+        seed: Optional[int] = None,
+    ):
+        if not 0.0 <= error_rate <= 1.0:
+            raise ValueError("error_rate must be between 0 and 1.")
+        self.latency = Latency(latency)
+        self.ttft = Latency(ttft)
+        self.load_ms = load_ms
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses or [429, 500]
+        self.retry_after = retry_after
+        self.response = DEFAULT_RESPONSE if response is None else response
+        self.chunks = max(1, chunks)
+        self.parallel = parallel
+        self.seed = seed
+
+
+def create_app(settings: Optional[MockSettings] = None) -> FastAPI:
+    settings = settings or MockSettings()
+    rng = random.Random(settings.seed)
+    text = json.dumps(settings.response)
+    step = max(1, math.ceil(len(text) / settings.chunks))
+    parts = [text[start : start + step] for start in range(0, len(text), step)]
+    # Like a model server, only ``parallel`` requests generate at once; the rest queue.
+    slots = asyncio.Semaphore(settings.parallel) if settings.parallel > 0 else None
+    loaded: set = set()
+    stats = {"requests": 0, "errors": 0, "streamed": 0, "in_flight": 0, "max_in_flight": 0}
+
+    app = FastAPI(title="Mock VLM")
+
+    def plan(model: str) -> Optional[Dict[str, Any]]:
+        """Draw one request's error or timings up front so a seed gives the same run."""
+        stats["requests"] += 1
+        if settings.error_rate and rng.random() < settings.error_rate:
+            stats["errors"] += 1
+            return {"error": rng.choice(settings.error_statuses)}
+        total = settings.latency.sample(rng)
+        first = min(settings.ttft.sample(rng), total)
+        load = 0.0
+        if model not in loaded:
+            loaded.add(model)
+            load = settings.load_ms
+        return {"load": load, "first": first, "rest": total - first}
+
+    def error_response(status: int) -> JSONResponse:
+        headers = {}
+        if settings.retry_after is not None:
+            headers["Retry-After"] = f"{settings.retry_after:g}"
+        return JSONResponse({"error": f"mock error {status}"}, status_code=status, headers=headers)
+
+    def usage(body: Dict[str, Any], images: List[str]) -> Dict[str, int]:
+        # Rough counts: ~4 characters per text token, ~1 token per 750 base64 characters.
+        prompt = sum(len(image) for image in images) // 750 + len(json.dumps(body)) // 4
+        return {"prompt": prompt, "completion": max(1, len(text) // 4)}
+
+    async def generate(timing: Dict[str, Any]):
+        """Yield the canned answer's parts, paced by the planned timings."""
+        if slots is not None:
+            await slots.acquire()
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            await asyncio.sleep((timing["load"] + timing["first"]) / 1000)
+            gap = timing["rest"] / 1000 / max(1, len(parts) - 1)
+            for index, part in enumerate(parts):
+                if index:
+                    await asyncio.sleep(gap)
+                yield part
+        finally:
+            stats["in_flight"] -= 1
+            if slots is not None:
+                slots.release()
+
+    @app.post("/api/generate")
+    async def ollama_generate(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        timing = plan(model)
+        if "error" in timing:
+            return error_response(timing["error"])
+        counts = usage(body, body.get("images") or [])
+        start = time.perf_counter()
+
+        def final() -> Dict[str, Any]:
+            return {
+                "model": model,
+                "done": True,
+                "done_reason": "stop",
+                "total_duration": int((time.perf_counter() - start) * 1e9),
+                "load_duration": int(timing["load"] * 1e6),
+                "prompt_eval_count": counts["prompt"],
+                "prompt_eval_duration": int(timing["first"] * 1e6),
+                "eval_count": counts["completion"],
+                "eval_duration": int(timing["rest"] * 1e6),
+            }
+
+        if not body.get("stream", True):
+            answer = "".join([part async for part in generate(timing)])
+            return {**final(), "response": answer}
+
+        async def lines():
+            stats["streamed"] += 1
+            async for part in generate(timing):
+                yield json.dumps({"model": model, "response": part, "done": False}) + "\n"
+            yield json.dumps({**final(), "response": ""}) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        timing = plan(model)
+        if "error" in timing:
+            return error_response(timing["error"])
+        images = [
+            item["image_url"]["url"]
+            for message in body.get("messages", [])
+            if isinstance(message.get("content"), list)
+            for item in message["content"]
+            if item.get("type") == "image_url"
+        ]
+        counts = usage(body, images)
+        token_usage = {
+            "prompt_tokens": counts["prompt"],
+            "completion_tokens": counts["completion"],
+            "total_tokens": counts["prompt"] + counts["completion"],
+        }
+        base = {
+            "id": f"chatcmpl-mock{stats['requests']}",
+            "created": int(time.time()),
+            "model": model,
+        }
+
+        if not body.get("stream"):
+            answer = "".join([part async for part in generate(timing)])
+            return {
+                **base,
+                "object": "chat.completion",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": answer},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": token_usage,
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+        def event(choices: List[Dict[str, Any]], **extra) -> str:
+            chunk = {**base, "object": "chat.completion.chunk", "choices": choices, **extra}
+            return f"data: {json.dumps(chunk)}\n\n"
+
+        async def events():
+            stats["streamed"] += 1
+            async for part in generate(timing):
+                yield event([{"index": 0, "delta": {"content": part}, "finish_reason": None}])
+            yield event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if include_usage:
+                yield event([], usage=token_usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+class MockServer:
+    """Run the mock on a background thread, e.g. inside a benchmark."""
+
+    def __init__(
+        self, settings: Optional[MockSettings] = None, host: str = "127.0.0.1", port: int = 0
+    ):
+        self.server = uvicorn.Server(
+            uvicorn.Config(create_app(settings), host=host, port=port, log_level="warning")
+        )
+        self.host = host
+        self.port = port
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self, timeout: float = 10.0) -> "MockServer":
+        self._thread = threading.Thread(target=self.server.run, name="mock-vlm", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("Mock VLM server did not start.")
+            time.sleep(0.05)
+        if not self.port:
+            self.port = self.server.servers[0].sockets[0].getsockname()[1]
+        return self
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+
+def _response_arg(value: str) -> Dict[str, Any]:
+    if value.startswith("@"):
+        with open(value[1:], encoding="utf-8") as handle:
+            return json.load(handle)
+    return json.loads(value)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--latency", default="lognormal:800,0.4", help="Total generation time per request"
+    )
+    parser.add_argument("--ttft", default="uniform:100,300", help="Time to first token per request")
+    parser.add_argument(
+        "--load-ms", type=float, default=0.0, help="Cold start added to each model's first request"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Fraction of requests that fail (0-1)"
+    )
+    parser.add_argument(
+        "--error-status",
+        default="429,500",
+        help="Comma-separated statuses failed requests return, picked at random",
+    )
+    parser.add_argument(
+        "--retry-after", type=float, default=None, help="Retry-After seconds on errors"
+    )
+    parser.add_argument(
+        "--response", type=_response_arg, default=None, help="Canned JSON answer, or @file"
+    )
+    parser.add_argument("--chunks", type=int, default=8, help="Streamed chunks per answer")
+    parser.add_argument(
+        "--parallel", type=int, default=0, help="Requests generated at once; 0 = unlimited"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="Seed for reproducible latencies and errors"
+    )
+
+
+def settings_from_args(args: argparse.Namespace) -> MockSettings:
+    return MockSettings(
+        latency=args.latency,
+        ttft=args.ttft,
+        load_ms=args.load_ms,
+        error_rate=args.error_rate,
+        error_statuses=[int(status) for status in args.error_status.split(",") if status.strip()],
+        retry_after=args.retry_after,
+        response=args.response,
+        chunks=args.chunks,
+        parallel=args.parallel,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    add_arguments(parser)
+    args = parser.parse_args()
+    try:
+        settings = settings_from_args(args)
+    except ValueError as exc:
+        parser.error(str(exc))
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
@@ -115,11 +115,14 @@ export default function AnnotationReview({ apiBase, document, runs, pages }) {
       };
     }
 
+    // Pixel boxes are in the provider's raster, which has its own dpi.
+    const rasterWidth = currentPageData?.width || currentPageImage.width;
+    const rasterHeight = currentPageData?.height || currentPageImage.height;
     return {
-      left: `${(x1 / currentPageImage.width) * 100}%`,
-      top: `${(y1 / currentPageImage.height) * 100}%`,
-      width: `${((x2 - x1) / currentPageImage.width) * 100}%`,
-      height: `${((y2 - y1) / currentPageImage.height) * 100}%`,
+      left: `${(x1 / rasterWidth) * 100}%`,
+      top: `${(y1 / rasterHeight) * 100}%`,
+      width: `${((x2 - x1) / rasterWidth) * 100}%`,
+      height: `${((y2 - y1) / rasterHeight) * 100}%`,
     };
   };
 
@@ -137,14 +137,19 @@ export default function Viewer({
     );
     if (!pageOutput) return null;
 
+    // Boxes are in the pixels of the raster the provider saw, which has its own dpi;
+    // older runs without a stored size used the rendered page.
+    const rasterWidth = pageOutput.width || page.width;
+    const rasterHeight = pageOutput.height || page.height;
+
     const overlays = [];
-    if (pageOutput.detections && page.width && page.height) {
+    if (pageOutput.detections && rasterWidth && rasterHeight) {
       pageOutput.detections.forEach((det, index) => {
         const [x1, y1, x2, y2] = det.bbox;
-        const left = (x1 / page.width) * 100;
-        const top = (y1 / page.height) * 100;
-        const width = ((x2 - x1) / page.width) * 100;
-        const height = ((y2 - y1) / page.height) * 100;
+        const left = (x1 / rasterWidth) * 100;
+        const top = (y1 / rasterHeight) * 100;
+        const width = ((x2 - x1) / rasterWidth) * 100;
+        const height = ((y2 - y1) / rasterHeight) * 100;
         overlays.push(
           <div
             key={`det-${index}`}
@@ -155,13 +160,13 @@ export default function Viewer({
         );
       });
     }
-    if (pageOutput.words && page.width && page.height) {
+    if (pageOutput.words && rasterWidth && rasterHeight) {
       pageOutput.words.slice(0, 400).forEach((word, index) => {
         const [x1, y1, x2, y2] = word.bbox;
-        const left = (x1 / page.width) * 100;
-        const top = (y1 / page.height) * 100;
-        const width = ((x2 - x1) / page.width) * 100;
-        const height = ((y2 - y1) / page.height) * 100;
+        const left = (x1 / rasterWidth) * 100;
+        const top = (y1 / rasterHeight) * 100;
+        const width = ((x2 - x1) / rasterWidth) * 100;
+        const height = ((y2 - y1) / rasterHeight) * 100;
         overlays.push(
           <div
             key={`ocr-${index}`}